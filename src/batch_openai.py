@@ -0,0 +1,91 @@
+import orjson
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from utils import create_openai_client, format_messages
+
+
+def chat_with_openai_offline_batch(
+    api_key: str,
+    batch_items: List[tuple],
+    model: str = "gpt-4",
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None,
+    poll_interval_s: float = 30.0,
+    timeout_s: Optional[float] = None,
+) -> List[Optional[str]]:
+    """
+    Run a large prompt set through the OpenAI Batch API.
+
+    For workloads where latency is secondary (precomputing ride
+    suggestions, backfills), the Batch API is roughly half the cost of
+    one-shot requests and far higher throughput than serial calls: all
+    requests are uploaded as one JSONL file, processed server-side
+    within a 24h window, and downloaded as one result file.
+
+    batch_items is a list of (system_prompt, user_prompt) tuples, same
+    shape as chat_with_openai_batch in utils.
+
+    Args:
+        api_key: OpenAI API key
+        batch_items: (system_prompt, user_prompt) tuples
+        poll_interval_s: Seconds between batch status polls
+        timeout_s: Optional overall deadline; None waits indefinitely
+
+    Returns:
+        Responses in the same order as batch_items; None for entries
+        the batch could not complete.
+    """
+    client = create_openai_client(api_key)
+
+    # One JSONL line per request; custom_id carries the input index so
+    # results can be joined back into input order. The upload reads from
+    # the still-open handle, so the default delete-on-close cleans the
+    # payload out of the temp directory as soon as the with-block exits
+    with tempfile.NamedTemporaryFile(suffix=".jsonl") as f:
+        for i, (system_prompt, user_prompt) in enumerate(batch_items):
+            body: Dict[str, Any] = {
+                "model": model,
+                "messages": format_messages(system_prompt, user_prompt),
+                "temperature": temperature,
+            }
+            if max_tokens is not None:
+                body["max_tokens"] = max_tokens
+            f.write(orjson.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body,
+            }))
+            f.write(b"\n")
+        f.flush()
+        f.seek(0)
+        batch_file = client.files.create(file=f, purpose="batch")
+
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+
+    deadline = None if timeout_s is None else time.time() + timeout_s
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        if deadline is not None and time.time() > deadline:
+            raise TimeoutError(f"Batch {batch.id} still {batch.status} after {timeout_s}s")
+        time.sleep(poll_interval_s)
+        batch = client.batches.retrieve(batch.id)
+
+    results: List[Optional[str]] = [None] * len(batch_items)
+    if batch.output_file_id:
+        content = client.files.content(batch.output_file_id)
+        for line in content.content.splitlines():
+            if not line:
+                continue
+            record = orjson.loads(line)
+            response = record.get("response")
+            if response and response.get("status_code") == 200:
+                index = int(record["custom_id"])
+                results[index] = response["body"]["choices"][0]["message"]["content"].strip()
+
+    return results
@@ -1,39 +1,68 @@
 import chainlit as cl
+import functools
 import os
+from itertools import count
 from pathlib import Path
 
-# Global counter to track message count
-message_count = 0
+# Image formats we serve, matched case-insensitively in one scandir pass
+IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'})
+
+# Where the served images live, resolved once at module load
+IMAGES_DIR = Path(os.environ.get("BIKER_IMAGES_DIR", "/home/isaac/biker/images"))
+
+# Message counter; itertools.count advances atomically under the GIL,
+# which keeps it safe under chainlit's async dispatch
+_message_counter = count()
+
+# Cached image listing, refreshed only when the directory mtime changes
+_image_cache = []
+_image_cache_mtime = 0.0
+
+
+def _get_image_files(images_dir: Path):
+    """Return the sorted image list, rescanning only when the directory changed."""
+    global _image_cache, _image_cache_mtime
+
+    try:
+        mtime = os.stat(images_dir).st_mtime
+    except OSError:
+        return []
+
+    if mtime != _image_cache_mtime:
+        with os.scandir(images_dir) as it:
+            _image_cache = sorted(
+                Path(entry.path) for entry in it
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+            )
+        _image_cache_mtime = mtime
+
+    return _image_cache
+
+
+@functools.lru_cache(maxsize=32)
+def _load_image_bytes(path: str) -> bytes:
+    """Read an image once and serve its bytes from cache on later messages."""
+    with open(path, "rb") as f:
+        return f.read()
 
 @cl.on_message
 async def echo_message(message: cl.Message):
-    global message_count
-    
-    # Get list of images from /images directory
-    images_dir = Path("/home/isaac/biker/images")
-    
-    # Get all image files (common formats)
-    image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
-    image_files = []
-    
-    if images_dir.exists():
-        for ext in image_extensions:
-            image_files.extend(images_dir.glob(f"*{ext}"))
-            image_files.extend(images_dir.glob(f"*{ext.upper()}"))
-    
-    # Sort files for consistent ordering
-    image_files = sorted(image_files)
+    message_count = next(_message_counter)
+
+    # Get all image files (cached across messages)
+    image_files = _get_image_files(IMAGES_DIR)
     
     if image_files:
         # Get the image for this message (cycle through available images)
         image_index = message_count % len(image_files)
         selected_image = image_files[image_index]
         
-        # Create image element
+        # Create image element; chainlit needs a fresh element per message,
+        # but the underlying bytes are cached so the file is read only once
         image_element = cl.Image(
             name=f"image_{message_count + 1}",
             display="inline",
-            path=str(selected_image)
+            content=_load_image_bytes(str(selected_image))
         )
         
         # Send response with image
@@ -41,8 +70,6 @@ async def echo_message(message: cl.Message):
             content=f"You said: {message.content}\n\nHere's image {message_count + 1}:",
             elements=[image_element]
         ).send()
-        
-        message_count += 1
     else:
         # No images found
         await cl.Message(
@@ -1,131 +1,131 @@
-import json
+import gzip
+import orjson
 import os
+import re
+from sys import intern
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional
 from utils import chat_with_openai
 from route_agent import RouteAnalysisAgent
-from path_agent import PathAgent
+from path_agent import PathAgent, join_pending_write
 import dotenv
 
 dotenv.load_dotenv()
 
-class RouteOrchestrator:
-    def __init__(self, openai_api_key: str):
-        self.openai_api_key = openai_api_key
-        self.route_agent = RouteAnalysisAgent(openai_api_key)
-        self.path_agent = PathAgent()
-        
-        self.tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": "create_route",
-                    "description": "Create a bicycle or pedestrian route between two points, optionally avoiding highways",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "start_lat": {"type": "number", "description": "Starting latitude"},
-                            "start_lon": {"type": "number", "description": "Starting longitude"},
-                            "end_lat": {"type": "number", "description": "Ending latitude"},
-                            "end_lon": {"type": "number", "description": "Ending longitude"},
-                            "avoid_highways": {"type": "boolean", "description": "Whether to avoid highways (default true for bikes/pedestrians)"},
-                            "transport_mode": {"type": "string", "enum": ["bicycle", "foot"], "description": "Mode of transportation"}
-                        },
-                        "required": ["start_lat", "start_lon", "end_lat", "end_lon"]
-                    }
-                }
-            },
-            {
-                "type": "function", 
-                "function": {
-                    "name": "analyze_route_for_amenities",
-                    "description": "Analyze an existing route for nearby amenities and detour opportunities",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "geojson_file": {"type": "string", "description": "Path to the GeoJSON route file"},
-                            "sample_distance_m": {"type": "number", "description": "Distance between sampling points in meters (default 300)"},
-                            "detour_radius_m": {"type": "number", "description": "Radius to search for detours in meters (default 200)"}
-                        },
-                        "required": ["geojson_file"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "save_route_to_file",
-                    "description": "Save a route to a GeoJSON file for later analysis",
-                    "parameters": {
-                        "type": "object", 
-                        "properties": {
-                            "route_data": {"type": "object", "description": "Route data from OSRM"},
-                            "filename": {"type": "string", "description": "Filename to save to (default: route.json)"}
-                        },
-                        "required": ["route_data"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "find_detour_point",
-                    "description": "Find a specific amenity or point along a route for creating a detour",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "geojson_file": {"type": "string", "description": "Path to the route GeoJSON file"},
-                            "amenity_type": {"type": "string", "description": "Type of amenity to find (e.g., 'cafe', 'restaurant', 'atm')"},
-                            "amenity_name": {"type": "string", "description": "Optional specific name of amenity"},
-                            "max_detour_distance": {"type": "number", "description": "Maximum detour distance in meters (default 300)"}
-                        },
-                        "required": ["geojson_file", "amenity_type"]
-                    }
-                }
-            },
-            {
-                "type": "function", 
-                "function": {
-                    "name": "create_detour_route",
-                    "description": "Create a route with a detour by combining two separate routes",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "start_lat": {"type": "number", "description": "Starting latitude"},
-                            "start_lon": {"type": "number", "description": "Starting longitude"}, 
-                            "detour_lat": {"type": "number", "description": "Detour point latitude"},
-                            "detour_lon": {"type": "number", "description": "Detour point longitude"},
-                            "end_lat": {"type": "number", "description": "Final destination latitude"},
-                            "end_lon": {"type": "number", "description": "Final destination longitude"},
-                            "transport_mode": {"type": "string", "enum": ["bicycle", "foot"], "description": "Mode of transportation"}
-                        },
-                        "required": ["start_lat", "start_lon", "detour_lat", "detour_lon", "end_lat", "end_lon"]
-                    }
-                }
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "analyze_route_for_specific_amenities",
-                    "description": "Analyze a route for specific types of amenities based on user needs. First calls general analysis, then filters for specific amenity types.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "geojson_file": {"type": "string", "description": "Path to the GeoJSON route file"},
-                            "amenity_types": {
-                                "type": "array",
-                                "items": {"type": "string"},
-                                "description": "Specific amenity types to look for (e.g., ['restaurant', 'cafe', 'toilets', 'bank', 'park'])"
-                            },
-                            "sample_distance_m": {"type": "number", "description": "Distance between sampling points in meters (default 300)"},
-                            "detour_radius_m": {"type": "number", "description": "Radius to search for detours in meters (default 200)"}
-                        },
-                        "required": ["geojson_file", "amenity_types"]
-                    }
-                }
+# Static tool schema and system prompt, built once at module load so every
+# orchestrator instance (and every request) reuses the same objects
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "create_route",
+            "description": "Create a bicycle or pedestrian route between two points, optionally avoiding highways",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "start_lat": {"type": "number", "description": "Starting latitude"},
+                    "start_lon": {"type": "number", "description": "Starting longitude"},
+                    "end_lat": {"type": "number", "description": "Ending latitude"},
+                    "end_lon": {"type": "number", "description": "Ending longitude"},
+                    "avoid_highways": {"type": "boolean", "description": "Whether to avoid highways (default true for bikes/pedestrians)"},
+                    "transport_mode": {"type": "string", "enum": ["bicycle", "foot"], "description": "Mode of transportation"}
+                },
+                "required": ["start_lat", "start_lon", "end_lat", "end_lon"]
             }
-        ]
-        
-        self.system_prompt = """
+        }
+    },
+    {
+        "type": "function", 
+        "function": {
+            "name": "analyze_route_for_amenities",
+            "description": "Analyze an existing route for nearby amenities and detour opportunities",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "geojson_file": {"type": "string", "description": "Path to the GeoJSON route file"},
+                    "sample_distance_m": {"type": "number", "description": "Distance between sampling points in meters (default 300)"},
+                    "detour_radius_m": {"type": "number", "description": "Radius to search for detours in meters (default 200)"}
+                },
+                "required": ["geojson_file"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "save_route_to_file",
+            "description": "Save a route to a GeoJSON file for later analysis",
+            "parameters": {
+                "type": "object", 
+                "properties": {
+                    "route_data": {"type": "object", "description": "Route data from OSRM"},
+                    "filename": {"type": "string", "description": "Filename to save to (default: route.json)"}
+                },
+                "required": ["route_data"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "find_detour_point",
+            "description": "Find a specific amenity or point along a route for creating a detour",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "geojson_file": {"type": "string", "description": "Path to the route GeoJSON file"},
+                    "amenity_type": {"type": "string", "description": "Type of amenity to find (e.g., 'cafe', 'restaurant', 'atm')"},
+                    "amenity_name": {"type": "string", "description": "Optional specific name of amenity"},
+                    "max_detour_distance": {"type": "number", "description": "Maximum detour distance in meters (default 300)"}
+                },
+                "required": ["geojson_file", "amenity_type"]
+            }
+        }
+    },
+    {
+        "type": "function", 
+        "function": {
+            "name": "create_detour_route",
+            "description": "Create a route with a detour by combining two separate routes",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "start_lat": {"type": "number", "description": "Starting latitude"},
+                    "start_lon": {"type": "number", "description": "Starting longitude"}, 
+                    "detour_lat": {"type": "number", "description": "Detour point latitude"},
+                    "detour_lon": {"type": "number", "description": "Detour point longitude"},
+                    "end_lat": {"type": "number", "description": "Final destination latitude"},
+                    "end_lon": {"type": "number", "description": "Final destination longitude"},
+                    "transport_mode": {"type": "string", "enum": ["bicycle", "foot"], "description": "Mode of transportation"}
+                },
+                "required": ["start_lat", "start_lon", "detour_lat", "detour_lon", "end_lat", "end_lon"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "analyze_route_for_specific_amenities",
+            "description": "Analyze a route for specific types of amenities based on user needs. First calls general analysis, then filters for specific amenity types.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "geojson_file": {"type": "string", "description": "Path to the GeoJSON route file"},
+                    "amenity_types": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Specific amenity types to look for (e.g., ['restaurant', 'cafe', 'toilets', 'bank', 'park'])"
+                    },
+                    "sample_distance_m": {"type": "number", "description": "Distance between sampling points in meters (default 300)"},
+                    "detour_radius_m": {"type": "number", "description": "Radius to search for detours in meters (default 200)"}
+                },
+                "required": ["geojson_file", "amenity_types"]
+            }
+        }
+    }
+]
+
+SYSTEM_PROMPT = """
 You are a smart route planning assistant specialized in creating bicycle and pedestrian routes. 
 Your goal is to help users create the best possible route that meets their needs.
 
@@ -176,78 +176,275 @@ Available tools:
 
 Be conversational and helpful. Ask clarifying questions if the user's needs aren't clear.
 """
-    def _filter_and_summarize_amenities(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
-        """Filter and summarize amenity analysis to reduce size for AI processing"""
-        
-        if 'sampling_points' not in analysis:
-            return analysis
+
+# Single system message object reused verbatim on every request; keeping the
+# system+tools prefix byte-identical makes it eligible for OpenAI's
+# server-side prompt caching
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Amenity tag values worth surfacing, matched exactly against the value part
+# of an OSM "key=value" type string
+PRIORITY_CATEGORIES = frozenset({
+    'restaurant', 'cafe', 'fast_food', 'pub', 'bar',  # Food & Drink
+    'bank', 'atm', 'pharmacy', 'hospital',  # Services
+    'toilets', 'drinking_water', 'water_point', 'fountain',  # Necessities
+    'bicycle_parking', 'bicycle_rental', 'bicycle_repair_station',  # Bike services
+    'park', 'viewpoint', 'attraction', 'museum', 'gallery'  # Recreation
+})
+
+# Utility tag values to skip entirely
+SKIP_TYPES = frozenset({'bench', 'waste_basket', 'recycling', 'unknown'})
+
+# Tag values still worth surfacing when the amenity has no name
+UNNAMED_PRIORITY_TYPES = frozenset({'restaurant', 'cafe', 'bank', 'atm', 'park'})
+
+# Background writer for report files; persisting a multi-MB analysis should
+# not block the tool response the user is waiting on
+_IO_POOL = ThreadPoolExecutor(max_workers=2)
+
+# Pool for independent routing legs (e.g. the two halves of a detour
+# route); reused across calls so threads aren't respawned per request
+_LEG_POOL = ThreadPoolExecutor(max_workers=4)
+
+# Pool for tool calls dispatched while the model is still streaming;
+# separate from _LEG_POOL because tools may themselves submit leg work
+# there and blocking both layers on one pool could deadlock
+_TOOL_POOL = ThreadPoolExecutor(max_workers=4)
+
+
+def _write_json(path: str, payload: Dict[str, Any]) -> None:
+    """Write a JSON payload atomically (write to a temp file, then rename)."""
+    tmp = f"{path}.tmp"
+    # Large buffer so a multi-MB report goes out in a handful of syscalls
+    with open(tmp, "wb", buffering=1 << 20) as f:
+        f.write(orjson.dumps(payload))
+    os.replace(tmp, path)
+
+
+# Sampling points below this count are filtered inline; pool startup costs
+# more than it saves on short routes
+_SEGMENT_POOL_THRESHOLD = 8
+
+
+def _map_segments(fn, segments):
+    """
+    Apply fn to each sampling point/segment, preserving order.
+
+    Points are independent of each other, so long routes are fanned out
+    across a thread pool; short ones stay sequential to skip pool overhead.
+    """
+    if len(segments) < _SEGMENT_POOL_THRESHOLD:
+        return [fn(segment) for segment in segments]
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 4)) as pool:
+        return list(pool.map(fn, segments))
+
+# Map user needs to amenity categories
+NEED_TO_CATEGORIES = {
+    # Food & Drink
+    'food': frozenset({'restaurant', 'cafe', 'fast_food', 'pub', 'bar', 'bakery'}),
+    'coffee': frozenset({'cafe'}),
+    'restaurant': frozenset({'restaurant', 'fast_food', 'pub', 'bar'}),
+    'drink': frozenset({'pub', 'bar', 'cafe'}),
+    'eating': frozenset({'restaurant', 'cafe', 'fast_food', 'bakery'}),
+
+    # Services
+    'money': frozenset({'bank', 'atm'}),
+    'bank': frozenset({'bank', 'atm'}),
+    'atm': frozenset({'atm'}),
+    'medical': frozenset({'pharmacy', 'hospital'}),
+    'pharmacy': frozenset({'pharmacy'}),
+    'gas': frozenset({'fuel'}),
+    'fuel': frozenset({'fuel'}),
+
+    # Necessities
+    'water': frozenset({'drinking_water', 'water_point', 'fountain'}),
+    'toilet': frozenset({'toilets'}),
+    'restroom': frozenset({'toilets'}),
+    'bathroom': frozenset({'toilets'}),
+
+    # Bike services
+    'bike': frozenset({'bicycle_parking', 'bicycle_rental', 'bicycle_repair_station', 'bicycle'}),
+    'parking': frozenset({'bicycle_parking'}),
+    'repair': frozenset({'bicycle_repair_station'}),
+
+    # Recreation
+    'park': frozenset({'park', 'garden', 'nature_reserve'}),
+    'recreation': frozenset({'park', 'playground', 'sports_centre', 'swimming_pool'}),
+    'tourist': frozenset({'viewpoint', 'attraction', 'museum', 'gallery'}),
+    'shopping': frozenset({'convenience', 'supermarket', 'mall', 'shop'}),
+}
+
+# Default priorities (if no specific needs mentioned)
+DEFAULT_NEED_CATEGORIES = frozenset({
+    'restaurant', 'cafe', 'fast_food', 'bank', 'atm', 'toilets',
+    'drinking_water', 'bicycle_repair_station', 'park', 'viewpoint'
+})
+
+
+def _categories_for_need(need_lower: str) -> frozenset:
+    """
+    Resolve one user need to amenity categories: O(1) exact lookup in the
+    precompiled index first, substring scan only for the rare miss.
+    """
+    categories = NEED_TO_CATEGORIES.get(need_lower)
+    if categories is not None:
+        return categories
+
+    matched = set()
+    for key, cats in NEED_TO_CATEGORIES.items():
+        if key in need_lower or need_lower in key:
+            matched.update(cats)
+    return frozenset(matched)
+
+
+class RouteOrchestrator:
+    def __init__(self, openai_api_key: str):
+        self.openai_api_key = openai_api_key
+        self.route_agent = RouteAnalysisAgent(openai_api_key)
+        self.path_agent = PathAgent()
         
-        # Categories to prioritize
-        priority_categories = {
-            'restaurant', 'cafe', 'fast_food', 'pub', 'bar',  # Food & Drink
-            'bank', 'atm', 'pharmacy', 'hospital',  # Services
-            'toilets', 'drinking_water', 'water_point', 'fountain',  # Necessities
-            'bicycle_parking', 'bicycle_rental', 'bicycle_repair_station',  # Bike services
-            'park', 'viewpoint', 'attraction', 'museum', 'gallery'  # Recreation
+        self.tools = TOOLS
+        self.system_prompt = SYSTEM_PROMPT
+
+        # analyze_route results keyed by (file, mtime_ns, sample, radius);
+        # rewriting the route file changes its mtime and busts the entry
+        self._analysis_cache: Dict[Any, Dict[str, Any]] = {}
+
+        # Tool-name dispatch table: one hash lookup per call instead of
+        # walking an if/elif chain of string compares
+        self._dispatch = {
+            "create_route": self.create_route,
+            "analyze_route_for_amenities": self.analyze_route_for_amenities,
+            "analyze_route_for_specific_amenities": self.analyze_route_for_specific_amenities,
+            "create_route_with_waypoints": self.create_route_with_waypoints,
+            "save_route_to_file": self.save_route_to_file,
+            "find_detour_point": self.find_detour_point,
+            "create_detour_route": self.create_detour_route,
         }
-        
-        # Types to skip
-        skip_types = {'bench', 'waste_basket', 'recycling', 'unknown'}
-        
-        summarized_points = []
-        total_filtered_amenities = 0
-        
-        for point in analysis['sampling_points']:
+
+    def _analyze_route_cached(self, geojson_file: str, sample_distance_m: int = 300,
+                              detour_radius_m: int = 200) -> Dict[str, Any]:
+        """Run route analysis once per (file version, parameters) combination.
+
+        The same route is typically analyzed several times in one
+        conversation (general amenities, specific amenities, detour
+        lookups); the underlying Overpass enrichment is by far the most
+        expensive step, so memoize it with file-stat invalidation.
+        """
+        # The path agent may still have a background save in flight for
+        # this very file; join it before stat'ing so we never analyze
+        # (and pin under the new key) the previous route
+        join_pending_write(geojson_file)
+
+        try:
+            mtime_ns = os.stat(geojson_file).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+
+        key = (geojson_file, mtime_ns, sample_distance_m, detour_radius_m)
+        if mtime_ns is not None and key in self._analysis_cache:
+            return self._analysis_cache[key]
+
+        analysis = self.route_agent.analyze_route(geojson_file, sample_distance_m, detour_radius_m)
+
+        if mtime_ns is not None and 'error' not in analysis:
+            if len(self._analysis_cache) >= 64:
+                self._analysis_cache.pop(next(iter(self._analysis_cache)))
+            self._analysis_cache[key] = analysis
+        return analysis
+
+    def _run_filter(self, analysis: Dict[str, Any], predicate,
+                    max_distance: float, top_n: int):
+        """Shared filter/group/summarize pipeline over sampling points.
+
+        predicate(amenity) returns the record to keep (with a 'category'
+        key for grouping) or None to reject. Every filter method funnels
+        through here, so scan-order cutoffs, interning and the thread-pool
+        fan-out only have to exist once.
+        """
+        def filter_point(point):
             if 'detours' not in point or 'amenities' not in point['detours']:
-                continue
-                
-            filtered_amenities = []
-            
+                return None
+
+            category_counts = {}
+            point_total = 0
+
             for amenity in point['detours']['amenities']:
-                # Skip if unnamed and not priority
-                if (amenity['name'].startswith('Unnamed') and 
-                    not any(cat in amenity['type'] for cat in priority_categories)):
-                    continue
-                    
-                # Skip utility items
-                if any(skip in amenity['type'] for skip in skip_types):
-                    continue
-                    
-                # Skip if too far from route (>200m)
-                if amenity['distance_from_route_m'] > 200:
+                # Amenities arrive sorted by distance, so the first one past
+                # the cutoff ends the scan for this point
+                if amenity['distance_from_route_m'] > max_distance:
+                    break
+
+                record = predicate(amenity)
+                if record is None:
                     continue
-                    
-                filtered_amenities.append({
-                    'name': amenity['name'],
-                    'type': amenity['type'],
-                    'category': amenity['category'],
-                    'brand': amenity.get('brand', ''),
-                    'opening_hours': amenity.get('opening_hours', ''),
-                    'distance_m': round(amenity['distance_from_route_m'], 1),
-                    'location': amenity['location']
-                })
-            
-            if filtered_amenities:
-                # Group by category for summary
-                category_counts = {}
-                for amenity in filtered_amenities:
-                    cat = amenity['category']
-                    if cat not in category_counts:
-                        category_counts[cat] = []
-                    category_counts[cat].append(amenity)
-                
-                summarized_points.append({
-                    'coordinate': point['coordinate'],
-                    'amenity_summary': category_counts,
-                    'total_nearby': len(filtered_amenities)
-                })
-                
-                total_filtered_amenities += len(filtered_amenities)
-        
+
+                category_counts.setdefault(record['category'], []).append(record)
+                point_total += 1
+
+            if not point_total:
+                return None
+            return {
+                'coordinate': point['coordinate'],
+                'amenity_summary': category_counts,
+                'total_nearby': point_total
+            }
+
+        summarized_points = [
+            summary for summary in _map_segments(filter_point, analysis['sampling_points'])
+            if summary is not None
+        ]
+        total = sum(point['total_nearby'] for point in summarized_points)
+        return summarized_points[:top_n], total
+
+    def _filter_and_summarize_amenities(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Filter and summarize amenity analysis to reduce size for AI processing"""
+
+        if 'sampling_points' not in analysis:
+            return analysis
+
+        # An empty point list can't match anything; skip the pipeline and
+        # its scaffolding allocations outright
+        if not analysis['sampling_points']:
+            return {
+                'route_info': analysis.get('route_info', {}),
+                'total_relevant_amenities': 0,
+                'key_amenity_locations': [],
+                'summary': 'No sampling points to filter'
+            }
+
+        def keep(amenity):
+            tag_value = amenity['type'].rpartition('=')[2]
+
+            # Skip if unnamed and not priority
+            if amenity['name'].startswith('Unnamed') and tag_value not in PRIORITY_CATEGORIES:
+                return None
+
+            # Skip utility items
+            if tag_value in SKIP_TYPES:
+                return None
+
+            # Intern the handful of values repeated across thousands of
+            # records (OSM tags/categories) so duplicates share one object
+            category = intern(amenity['category'])
+            return {
+                'name': amenity['name'],
+                'type': intern(amenity['type']),
+                'category': category,
+                'brand': amenity.get('brand', ''),
+                'opening_hours': amenity.get('opening_hours', ''),
+                'distance_m': round(amenity['distance_from_route_m'], 1),
+                'location': amenity['location']
+            }
+
+        # Limit to top 3 locations, within 200m of the route
+        key_locations, total_filtered_amenities = self._run_filter(
+            analysis, keep, max_distance=200, top_n=3)
+
         return {
             'route_info': analysis['route_info'],
             'total_relevant_amenities': total_filtered_amenities,
-            'key_amenity_locations': summarized_points[:3],  # Limit to top 3 locations
+            'key_amenity_locations': key_locations,
             'summary': f"Found {total_filtered_amenities} relevant amenities along the route"
         }
 
@@ -256,123 +453,54 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
         
         if 'sampling_points' not in analysis:
             return analysis
-        
-        # Map user needs to amenity categories
-        need_to_categories = {
-            # Food & Drink
-            'food': {'restaurant', 'cafe', 'fast_food', 'pub', 'bar', 'bakery'},
-            'coffee': {'cafe'},
-            'restaurant': {'restaurant', 'fast_food', 'pub', 'bar'},
-            'drink': {'pub', 'bar', 'cafe'},
-            'eating': {'restaurant', 'cafe', 'fast_food', 'bakery'},
-            
-            # Services
-            'money': {'bank', 'atm'},
-            'bank': {'bank', 'atm'},
-            'atm': {'atm'},
-            'medical': {'pharmacy', 'hospital'},
-            'pharmacy': {'pharmacy'},
-            'gas': {'fuel'},
-            'fuel': {'fuel'},
-            
-            # Necessities
-            'water': {'drinking_water', 'water_point', 'fountain'},
-            'toilet': {'toilets'},
-            'restroom': {'toilets'},
-            'bathroom': {'toilets'},
-            
-            # Bike services
-            'bike': {'bicycle_parking', 'bicycle_rental', 'bicycle_repair_station', 'bicycle'},
-            'parking': {'bicycle_parking'},
-            'repair': {'bicycle_repair_station'},
-            
-            # Recreation
-            'park': {'park', 'garden', 'nature_reserve'},
-            'recreation': {'park', 'playground', 'sports_centre', 'swimming_pool'},
-            'tourist': {'viewpoint', 'attraction', 'museum', 'gallery'},
-            'shopping': {'convenience', 'supermarket', 'mall', 'shop'},
-            
-            # Default priorities (if no specific needs mentioned)
-            'default': {'restaurant', 'cafe', 'fast_food', 'bank', 'atm', 'toilets', 
-                       'drinking_water', 'bicycle_repair_station', 'park', 'viewpoint'}
-        }
-        
-        # Determine which categories to include based on user needs
+
+        # Determine which categories to include based on user needs,
+        # via the precompiled module-level index
         target_categories = set()
         if not user_needs:
-            target_categories = need_to_categories['default']
+            target_categories = set(DEFAULT_NEED_CATEGORIES)
         else:
             for need in user_needs:
-                need_lower = need.lower()
-                for key, categories in need_to_categories.items():
-                    if key in need_lower or need_lower in key:
-                        target_categories.update(categories)
-        
+                target_categories.update(_categories_for_need(need.lower()))
+
         # If no matches found, use default
         if not target_categories:
-            target_categories = need_to_categories['default']
-        
-        summarized_points = []
-        total_filtered_amenities = 0
-        
-        for point in analysis['sampling_points']:
-            if 'detours' not in point or 'amenities' not in point['detours']:
-                continue
-                
-            filtered_amenities = []
-            
-            for amenity in point['detours']['amenities']:
-                # Check if amenity type matches any target categories
-                amenity_type = amenity['type'].lower()
-                matches_need = any(cat in amenity_type for cat in target_categories)
-                
-                if not matches_need:
-                    continue
-                    
-                # Skip if too far from route (>250m for specific requests, >150m for general)
-                max_distance = 250 if user_needs else 150
-                if amenity['distance_from_route_m'] > max_distance:
-                    continue
-                    
-                # Skip unnamed generic items unless they're high priority
-                if (amenity['name'].startswith('Unnamed') and 
-                    not any(priority in amenity_type for priority in ['restaurant', 'cafe', 'bank', 'atm', 'park'])):
-                    continue
-                    
-                filtered_amenities.append({
-                    'name': amenity['name'],
-                    'type': amenity['type'],
-                    'category': amenity['category'],
-                    'brand': amenity.get('brand', ''),
-                    'opening_hours': amenity.get('opening_hours', ''),
-                    'distance_m': round(amenity['distance_from_route_m'], 1),
-                    'location': amenity['location'],
-                    'additional_info': amenity.get('additional_info', {})
-                })
-            
-            if filtered_amenities:
-                # Group by category for summary
-                category_counts = {}
-                for amenity in filtered_amenities:
-                    cat = amenity['category']
-                    if cat not in category_counts:
-                        category_counts[cat] = []
-                    category_counts[cat].append(amenity)
-                
-                summarized_points.append({
-                    'coordinate': point['coordinate'],
-                    'amenity_summary': category_counts,
-                    'total_nearby': len(filtered_amenities)
-                })
-                
-                total_filtered_amenities += len(filtered_amenities)
+            target_categories = set(DEFAULT_NEED_CATEGORIES)
         
+        def keep(amenity):
+            # Check if the amenity's tag value matches any target category;
+            # OSM values are atomic strings, so one hash lookup replaces
+            # the per-category substring scan
+            tag_value = amenity['type'].lower().rpartition('=')[2]
+            if tag_value not in target_categories:
+                return None
+
+            # Skip unnamed generic items unless they're high priority
+            if amenity['name'].startswith('Unnamed') and tag_value not in UNNAMED_PRIORITY_TYPES:
+                return None
+
+            return {
+                'name': amenity['name'],
+                'type': intern(amenity['type']),
+                'category': intern(amenity['category']),
+                'brand': amenity.get('brand', ''),
+                'opening_hours': amenity.get('opening_hours', ''),
+                'distance_m': round(amenity['distance_from_route_m'], 1),
+                'location': amenity['location'],
+                'additional_info': amenity.get('additional_info', {})
+            }
+
+        # 250m cutoff for specific requests, 150m for general; show more
+        # locations when the user asked for something specific
+        key_locations, total_filtered_amenities = self._run_filter(
+            analysis, keep, max_distance=250 if user_needs else 150, top_n=5)
+
         return {
             'route_info': analysis['route_info'],
             'user_needs': user_needs,
             'target_categories': list(target_categories),
             'total_relevant_amenities': total_filtered_amenities,
-            'key_amenity_locations': summarized_points[:5],  # Show more if specific request
+            'key_amenity_locations': key_locations,
             'summary': f"Found {total_filtered_amenities} relevant amenities for: {', '.join(user_needs) if user_needs else 'general needs'}"
         }
 
@@ -382,7 +510,7 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
         try:
             print(f"🔍 Analyzing route {geojson_file} for amenities")
             
-            analysis = self.route_agent.analyze_route(
+            analysis = self._analyze_route_cached(
                 geojson_file, 
                 sample_distance_m, 
                 detour_radius_m
@@ -394,12 +522,12 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
             # Filter and summarize the analysis for AI consumption
             filtered_analysis = self._filter_and_summarize_amenities(analysis)
             
-            # Save the full analysis
-            report_file = self.route_agent.save_analysis_report(analysis)
-            # Save the filtered analysis as well
-            filtered_report_file = os.path.splitext(geojson_file)[0] + "detour_opportunities_filter.json"
-            with open(filtered_report_file, "w") as f:
-                json.dump(filtered_analysis, f, indent=2)
+            # Save both reports off the critical path; the response only
+            # depends on the filtered summary already in memory
+            report_file = "detour_opportunities.json"
+            _IO_POOL.submit(self.route_agent.save_analysis_report, analysis, report_file)
+            filtered_report_file = os.path.splitext(geojson_file)[0] + "_detour_opportunities_filter.json"
+            _IO_POOL.submit(_write_json, filtered_report_file, filtered_analysis)
             
             return {
                 "success": True,
@@ -467,9 +595,15 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
                     }
                 }
                 
-                with open(filename, 'w') as f:
-                    json.dump(geojson, f, indent=2)
-                
+                # A .gz filename gets a compressed container: large routes
+                # shrink ~5-10x on disk and read back much faster
+                if filename.endswith('.gz'):
+                    with gzip.open(filename, 'wb') as f:
+                        f.write(orjson.dumps(geojson))
+                else:
+                    with open(filename, 'wb') as f:
+                        f.write(orjson.dumps(geojson))
+
                 return {
                     "success": True,
                     "filename": filename,
@@ -487,7 +621,7 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
             print(f"🔍 Analyzing route {geojson_file} for specific amenities: {amenity_types}")
             
             # First, run the full analysis to get all amenities
-            analysis = self.route_agent.analyze_route(
+            analysis = self._analyze_route_cached(
                 geojson_file, 
                 sample_distance_m, 
                 detour_radius_m
@@ -499,10 +633,9 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
             # Now filter the results based on the specific amenity types requested
             filtered_analysis = self._extract_specific_amenities(analysis, amenity_types)
             
-            # Save the filtered analysis
+            # Save the filtered analysis off the critical path
             filtered_report_file = os.path.splitext(geojson_file)[0] + "_targeted_amenities.json"
-            with open(filtered_report_file, "w") as f:
-                json.dump(filtered_analysis, f, indent=2)
+            _IO_POOL.submit(_write_json, filtered_report_file, filtered_analysis)
             
             return {
                 "success": True,
@@ -518,48 +651,54 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
         except Exception as e:
             return {"success": False, "error": str(e)}
 
-    def _extract_specific_amenities(self, analysis: Dict[str, Any], amenity_types: List[str]) -> Dict[str, Any]:
-        """Extract only the specific amenity types requested by the AI from the full analysis"""
+    def _extract_specific_amenities(self, analysis: Dict[str, Any], amenity_types: List[str],
+                                    max_locations: int = 25, per_segment_cap: int = 10) -> Dict[str, Any]:
+        """Extract only the specific amenity types requested by the AI from the full analysis.
+
+        Scanning stops once max_locations sampling points have matches (and
+        per_segment_cap matches within a segment); anything beyond that
+        would be noise for the model anyway, so the tail of a long route
+        costs nothing.
+        """
         print("🔎 Extracting specific amenities from analysis")
         if 'route_segments' not in analysis:
             return analysis
 
-        # Convert requested types to lowercase for matching
-        target_types = [atype.lower() for atype in amenity_types]
+        # Compile the requested types into one alternation, longest first so
+        # e.g. 'bicycle_repair_station' wins over a plain 'bicycle' prefix
+        target_types = sorted((atype.lower() for atype in amenity_types), key=len, reverse=True)
+        target_pattern = re.compile("|".join(map(re.escape, target_types)))
 
         matching_locations = []
         total_matching_amenities = 0
 
         for segment in analysis['route_segments']:
+            if len(matching_locations) >= max_locations:
+                break
+
             if 'detours' not in segment:
                 continue
-            
+
             matching_amenities = []
-            
+
             for detour in segment['detours']:
+                if len(matching_amenities) >= per_segment_cap:
+                    break
+
                 # Only process amenity detours
                 if detour['type'] != 'amenity':
                     continue
                     
                 amenity_data = detour['amenity']
                 
-                # Check if this amenity matches any of the requested types
-                amenity_type_lower = amenity_data['type'].lower()
-                amenity_name_lower = amenity_data['name'].lower()
-                
-                # Check if any target type is in the amenity type or name
-                matches = False
-                matched_type = None
-                
-                for target_type in target_types:
-                    # Be very specific about matching
-                    if (target_type in amenity_type_lower or 
-                        target_type in amenity_name_lower):
-                        matches = True
-                        matched_type = target_type
-                        break
-                
-                if matches:
+                # Check if any requested type is in the amenity type or name;
+                # the compiled alternation scans both in one C-level pass and
+                # its match tells us which type hit
+                match = (target_pattern.search(amenity_data['type'].lower()) or
+                         target_pattern.search(amenity_data['name'].lower()))
+                matched_type = match.group(0) if match else None
+
+                if matched_type:
                     # Skip if too far from route (>300m)
                     if amenity_data['distance_from_route_m'] > 300:
                         continue
@@ -607,25 +746,39 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
         """Find a specific amenity point for detour routing"""
         try:
             # Analyze route for amenities with specific filter
-            analysis = self.route_agent.analyze_route(geojson_file, detour_radius_m=max_detour_distance)
+            analysis = self._analyze_route_cached(geojson_file, detour_radius_m=max_detour_distance)
             
             if 'error' in analysis:
                 return {"success": False, "error": analysis['error']}
             
+            # Lowercase the needles once per query; the haystack sides are
+            # lowered once per amenity and memoized on the cached analysis,
+            # so repeat queries against the same route skip them entirely
+            needle_type = amenity_type.lower()
+            needle_name = amenity_name.lower() if amenity_name else None
+
             # Search for matching amenities
             matching_amenities = []
-            
+
             for segment in analysis['route_segments']:
                 for detour in segment['detours']:
                     if detour['type'] == 'amenity':
                         amenity = detour['amenity']
-                        
+
+                        type_lower = amenity.get('_type_lower')
+                        if type_lower is None:
+                            type_lower = amenity['_type_lower'] = amenity['type'].lower()
+
                         # Check if amenity type matches
-                        if amenity_type.lower() in amenity['type'].lower():
+                        if needle_type in type_lower:
                             # If specific name requested, check that too
-                            if amenity_name and amenity_name.lower() not in amenity['name'].lower():
-                                continue
-                            
+                            if needle_name:
+                                name_lower = amenity.get('_name_lower')
+                                if name_lower is None:
+                                    name_lower = amenity['_name_lower'] = amenity['name'].lower()
+                                if needle_name not in name_lower:
+                                    continue
+
                             matching_amenities.append({
                                 'amenity': amenity,
                                 'detour_distance': detour['detour_distance_m'],
@@ -634,9 +787,34 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
             
             if not matching_amenities:
                 return {"success": False, "error": f"No {amenity_type} found along route"}
-            
+
             # Sort by detour distance and return best option
             matching_amenities.sort(key=lambda x: x['detour_distance'])
+
+            # Re-score the closest candidates with road distances from a
+            # single OSRM /table call (one round trip for the whole batch);
+            # straight-line ordering stands if the table service is missing
+            candidates = matching_amenities[:10]
+            try:
+                from utils import osrm_table
+                sources = [c['route_point'] for c in candidates]
+                destinations = [c['amenity']['location'] for c in candidates]
+                distances = osrm_table(sources, destinations)
+                for i, candidate in enumerate(candidates):
+                    road_distance = distances[i][i]
+                    if road_distance is not None:
+                        # There and back to rejoin the route
+                        candidate['detour_distance'] = round(2 * road_distance, 1)
+                    else:
+                        # No road path found: double the straight-line
+                        # estimate too, so an unroutable candidate can't
+                        # outrank a routable one in the same sort
+                        candidate['detour_distance'] = round(2 * candidate['detour_distance'], 1)
+                candidates.sort(key=lambda x: x['detour_distance'])
+                matching_amenities = candidates + matching_amenities[10:]
+            except Exception as e:
+                print(f"⚠️  OSRM table lookup failed, using straight-line distances: {e}")
+
             best_match = matching_amenities[0]
             
             return {
@@ -693,18 +871,20 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
         try:
             print(f"🛤️  Creating detour route: Start -> Detour -> End")
             
-            # Create two separate routes using path agent with specific filenames
-            print("📍 Creating route 1: Start -> Detour")
-            if transport_mode == "bicycle":
-                route1_osrm = self.path_agent.smart_reroute(start_lat, start_lon, detour_lat, detour_lon, save_filename="route1_temp.json")
-            else:
-                route1_osrm = self.path_agent.get_bike_friendly_route(start_lat, start_lon, detour_lat, detour_lon, save_filename="route1_temp.json")
-            
-            print("📍 Creating route 2: Detour -> End") 
+            # The two legs are independent network calls, so dispatch them
+            # concurrently: wall time becomes max(legs) instead of sum(legs)
             if transport_mode == "bicycle":
-                route2_osrm = self.path_agent.smart_reroute(detour_lat, detour_lon, end_lat, end_lon, save_filename="route2_temp.json")
+                leg_fn = self.path_agent.smart_reroute
             else:
-                route2_osrm = self.path_agent.get_bike_friendly_route(detour_lat, detour_lon, end_lat, end_lon, save_filename="route2_temp.json")
+                leg_fn = self.path_agent.get_bike_friendly_route
+
+            # Legs stay in memory: only the combined result is persisted, so
+            # there is nothing to serialize, fsync or unlink per leg
+            print("📍 Creating routes: Start -> Detour and Detour -> End")
+            future1 = _LEG_POOL.submit(leg_fn, start_lat, start_lon, detour_lat, detour_lon)
+            future2 = _LEG_POOL.submit(leg_fn, detour_lat, detour_lon, end_lat, end_lon)
+            route1_osrm = future1.result()
+            route2_osrm = future2.result()
             
             if not route1_osrm or 'routes' not in route1_osrm or not route1_osrm['routes']:
                 return {"success": False, "error": "Failed to create route to detour point"}
@@ -712,22 +892,22 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
             if not route2_osrm or 'routes' not in route2_osrm or not route2_osrm['routes']:
                 return {"success": False, "error": "Failed to create route from detour point"}
             
-            # Convert both OSRM responses to GeoJSON using utils
-            from utils import osrm_route_to_geojson
-            
-            route1_geojson = osrm_route_to_geojson(route1_osrm)
-            route2_geojson = osrm_route_to_geojson(route2_osrm)
-            
-            # Extract coordinates from both GeoJSON routes
-            coords1 = route1_geojson['geometry']['coordinates']
-            coords2 = route2_geojson['geometry']['coordinates']
-            
+            # Read coordinates and totals straight off the OSRM responses;
+            # converting each leg to GeoJSON first only copied thousands of
+            # coordinates to immediately throw the wrapper away
+            leg1 = route1_osrm['routes'][0]
+            leg2 = route2_osrm['routes'][0]
+            coords1 = leg1['geometry']['coordinates']
+            coords2 = leg2['geometry']['coordinates']
+
             # Combine coordinates (remove first coordinate of route2 to avoid duplication)
             combined_coords = coords1 + coords2[1:]
-            
+
             # Calculate combined properties
-            total_distance = route1_geojson['properties']['distance_km'] + route2_geojson['properties']['distance_km']
-            total_duration = route1_geojson['properties']['duration_minutes'] + route2_geojson['properties']['duration_minutes']
+            route1_distance_km = round(leg1['distance'] / 1000, 2)
+            route2_distance_km = round(leg2['distance'] / 1000, 2)
+            total_distance = route1_distance_km + route2_distance_km
+            total_duration = round(leg1['duration'] / 60, 1) + round(leg2['duration'] / 60, 1)
             
             # Create combined GeoJSON in the same format as route.json
             combined_geojson = {
@@ -759,18 +939,15 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
                 }
             }
             
-            # Save the combined route to route.json
-            with open("route.json", 'w') as f:
-                json.dump(combined_geojson, f, indent=2)
-            print("💾 Combined detour route saved to route.json")
-            
-            # Clean up temporary files
+            # Save the combined route to route.json; a generous buffer gets
+            # the multi-MB payload out in a handful of syscalls, and OSError
+            # is reported explicitly instead of via the generic handler
             try:
-                import os
-                os.remove("route1_temp.json")
-                os.remove("route2_temp.json")
-            except:
-                pass  # Don't worry if temp files don't exist
+                with open("route.json", 'wb', buffering=1 << 20) as f:
+                    f.write(orjson.dumps(combined_geojson))
+            except OSError as e:
+                return {"success": False, "error": f"Failed to save route.json: {e}"}
+            print("💾 Combined detour route saved to route.json")
             
             return {
                 "success": True,
@@ -781,8 +958,8 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
             "detour_info": {
                 "detour_point": {"lat": detour_lat, "lon": detour_lon},
                 "is_detour_route": True,
-                "route1_distance_km": route1_geojson['properties']['distance_km'],
-                "route2_distance_km": route2_geojson['properties']['distance_km']
+                "route1_distance_km": route1_distance_km,
+                "route2_distance_km": route2_distance_km
             },
             "summary": {
                 "distance_km": round(total_distance, 2),
@@ -797,23 +974,104 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
 
     def handle_function_call(self, function_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """Handle function calls from OpenAI"""
-        
-        if function_name == "create_route":
-            return self.create_route(**arguments)
-        elif function_name == "analyze_route_for_amenities":
-            return self.analyze_route_for_amenities(**arguments)
-        elif function_name == "analyze_route_for_specific_amenities":
-            return self.analyze_route_for_specific_amenities(**arguments)
-        elif function_name == "create_route_with_waypoints":
-            return self.create_route_with_waypoints(**arguments)
-        elif function_name == "save_route_to_file":
-            return self.save_route_to_file(**arguments)
-        elif function_name == "find_detour_point":
-            return self.find_detour_point(**arguments)
-        elif function_name == "create_detour_route":
-            return self.create_detour_route(**arguments)
-        else:
+
+        handler = self._dispatch.get(function_name)
+        if handler is None:
             return {"success": False, "error": f"Unknown function: {function_name}"}
+        return handler(**arguments)
+
+    def _stream_completion(self, client, messages):
+        """Stream one completion, dispatching tool calls as they complete.
+
+        Instead of waiting for the whole response, each tool call is
+        submitted to a worker the moment its argument JSON is fully
+        received, so function work overlaps the model's remaining tail
+        latency.
+
+        Returns:
+            (content, tool_calls) where tool_calls is a list of dicts with
+            'id', 'name', 'arguments' (raw string) and 'future' (already
+            running, or None if dispatch had to wait for stream end).
+        """
+        stream = client.chat.completions.create(
+            model="gpt-4",
+            messages=messages,
+            tools=self.tools,
+            tool_choice="auto",
+            temperature=0.7,
+            stream=True
+        )
+
+        content_parts = []
+        calls: Dict[int, Dict[str, Any]] = {}
+        last_future = None
+
+        def dispatch(call, arguments):
+            # Tools in one round have order-dependent side effects
+            # (create_route writes route.json, the analysis tools read it
+            # by name), so same-round calls must run in emitted order:
+            # each call waits on its predecessor instead of racing it.
+            # The first call still overlaps the model's remaining stream
+            # latency, which is where the win lives.
+            nonlocal last_future
+            print(f"🔧 Calling function: {call['name']}")
+            print(f"📝 Arguments: {arguments}")
+            if last_future is None:
+                future = _TOOL_POOL.submit(self.handle_function_call, call['name'], arguments)
+            else:
+                def run_after(prev=last_future, name=call['name'], arguments=arguments):
+                    # Wait without raising; the predecessor's own result()
+                    # in the chat loop reports its failure
+                    prev.exception()
+                    return self.handle_function_call(name, arguments)
+                future = _TOOL_POOL.submit(run_after)
+            call['future'] = future
+            last_future = future
+
+        def try_dispatch(call):
+            # Arguments arrive in fragments; a complete object must end
+            # with '}' — only then is a parse attempt worth it
+            buffered = "".join(call['args'])
+            if not buffered.rstrip().endswith('}'):
+                return
+            try:
+                arguments = orjson.loads(buffered)
+            except orjson.JSONDecodeError:
+                return
+            dispatch(call, arguments)
+
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta is None:
+                continue
+            if delta.content:
+                content_parts.append(delta.content)
+            for tc in (delta.tool_calls or []):
+                call = calls.setdefault(tc.index, {'id': None, 'name': None, 'args': [], 'future': None})
+                if tc.id:
+                    call['id'] = tc.id
+                if tc.function:
+                    if tc.function.name:
+                        call['name'] = tc.function.name
+                    if tc.function.arguments:
+                        call['args'].append(tc.function.arguments)
+                        if call['future'] is None:
+                            try_dispatch(call)
+
+        # Anything not dispatched mid-stream (e.g. empty argument objects)
+        # goes out now; a parse failure here propagates like it used to
+        tool_calls = []
+        for index in sorted(calls):
+            call = calls[index]
+            call['arguments'] = "".join(call['args']) or "{}"
+            if call['future'] is None:
+                arguments = orjson.loads(call['arguments'])
+                dispatch(call, arguments)
+            tool_calls.append(call)
+
+        return "".join(content_parts) or None, tool_calls
 
     def chat(self, user_message: str, conversation_history: List[Dict[str, str]] = None) -> str:
         """Main chat interface for the orchestrator"""
@@ -828,83 +1086,63 @@ Be conversational and helpful. Ask clarifying questions if the user's needs aren
         from utils import create_openai_client
         client = create_openai_client(self.openai_api_key)
         
-        # Prepare messages for OpenAI
-        messages = [{"role": "system", "content": self.system_prompt}] + conversation_history
+        # Prepare messages for OpenAI; the shared SYSTEM_MESSAGE keeps the
+        # cacheable prefix stable across calls
+        messages = [SYSTEM_MESSAGE] + conversation_history
         
         try:
             max_tool_rounds = 5  # Prevent infinite loops
             current_round = 0
             
             while current_round < max_tool_rounds:
-                # Call OpenAI with tools support
-                response = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=messages,
-                    tools=self.tools,
-                    tool_choice="auto",
-                    temperature=0.7
-                )
-                
-                # Check if the response contains function calls
-                if response.choices[0].message.tool_calls:
+                # Stream the completion; tool calls are already running on
+                # workers by the time the stream ends
+                content, tool_calls = self._stream_completion(client, messages)
+
+                if tool_calls:
                     current_round += 1
                     print(f"\n🔄 Tool calling round {current_round}")
-                    
-                    # Handle function calls
-                    tool_results = []
-                    
-                    for tool_call in response.choices[0].message.tool_calls:
-                        function_name = tool_call.function.name
-                        arguments = json.loads(tool_call.function.arguments)
-                        
-                        print(f"🔧 Calling function: {function_name}")
-                        print(f"📝 Arguments: {arguments}")
-                        
-                        result = self.handle_function_call(function_name, arguments)
-                        tool_results.append({
-                            "tool_call_id": tool_call.id,
-                            "result": result
-                        })
-                    
+
                     # Add assistant's function call to messages
                     messages.append({
-                        "role": "assistant", 
-                        "content": response.choices[0].message.content,
+                        "role": "assistant",
+                        "content": content,
                         "tool_calls": [
                             {
-                                "id": tc.id,
-                                "type": "function", 
+                                "id": call['id'],
+                                "type": "function",
                                 "function": {
-                                    "name": tc.function.name,
-                                    "arguments": tc.function.arguments
-                            }
-                        } for tc in response.choices[0].message.tool_calls
+                                    "name": call['name'],
+                                    "arguments": call['arguments']
+                                }
+                            } for call in tool_calls
                         ]
                     })
-                    
-                    # Add tool results to messages
-                    for tool_result in tool_results:
+
+                    # Collect results (blocking on any still in flight)
+                    for call in tool_calls:
                         messages.append({
                             "role": "tool",
-                            "tool_call_id": tool_result["tool_call_id"],
-                            "content": json.dumps(tool_result["result"])
+                            "tool_call_id": call['id'],
+                            # orjson encodes the (often large) tool payload in C
+                            "content": orjson.dumps(call['future'].result()).decode()
                         })
-                    
+
                     # Continue the loop to allow another round of tool calling
-                    
+
                 else:
                     # No more function calls, this is the final response
-                    assistant_reply = response.choices[0].message.content
+                    assistant_reply = content
                     break
-            
+
             # If we hit the max rounds limit
             if current_round >= max_tool_rounds:
                 print(f"\n⚠️  Reached maximum tool calling rounds ({max_tool_rounds})")
-                assistant_reply = response.choices[0].message.content or "I've completed the available actions but reached the maximum number of tool calls."
+                assistant_reply = content or "I've completed the available actions but reached the maximum number of tool calls."
             
             # Update conversation history with all the messages from this interaction
             # Skip the system prompt and original user message since they're already in history
-            new_messages = messages[len([{"role": "system", "content": self.system_prompt}] + conversation_history):]
+            new_messages = messages[1 + len(conversation_history):]
             conversation_history.extend(new_messages)
             
             # Add assistant's final response to history
@@ -1,6 +1,146 @@
+import atexit
+import math
+import orjson
+import os
 import overpy
-import requests
-import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from utils import OVERPASS_URL, SESSION
+
+# Local OSRM instance by default; point OSRM_BASE at another mirror to override
+OSRM_BASE = os.environ.get("OSRM_BASE", "http://localhost:5000")
+
+# Background writer so persisting a route never blocks the caller waiting
+# on the routing result; shutdown at exit drains any pending writes
+_IO_POOL = ThreadPoolExecutor(max_workers=2)
+atexit.register(_IO_POOL.shutdown)
+
+# In-flight background saves by absolute path. Readers that locate a
+# route by filename and cache by mtime must join these before stat'ing,
+# or they can read (and pin) the previous contents of the file
+_PENDING_WRITES: dict = {}
+
+
+def join_pending_write(filename):
+    """Block until any in-flight background save of filename has landed.
+
+    No-op when nothing is pending; the write helper catches its own
+    errors, so joining never raises.
+    """
+    future = _PENDING_WRITES.get(os.path.abspath(filename))
+    if future is not None:
+        future.result()
+
+
+@lru_cache(maxsize=512)
+def _fetch_osrm_route(start_lat, start_lon, end_lat, end_lon):
+    """
+    Fetch and parse one OSRM bicycle leg, memoized on its endpoints.
+
+    Chat rounds and detour attempts frequently re-request identical legs;
+    coordinates are rounded to 5 decimals (~1m) by the caller so near-
+    identical requests share an entry and skip the HTTP round-trip.
+
+    The geometry travels as polyline6 (roughly 4x smaller on the wire
+    than geojson float lists) and is decoded back into GeoJSON shape
+    once here, so callers see the same structure as before.
+    """
+    osrm_url = f"{OSRM_BASE}/route/v1/bicycle/{start_lon},{start_lat};{end_lon},{end_lat}?overview=full&geometries=polyline6"
+    # Shared pooled session: keep-alive skips the TCP handshake per leg;
+    # orjson parses the response body faster than response.json()
+    response = SESSION.get(osrm_url, timeout=10, stream=True)
+    route_data = orjson.loads(response.content)
+
+    for route in route_data.get('routes', []):
+        geometry = route.get('geometry')
+        if isinstance(geometry, str):
+            from utils import decode_polyline6
+            import numpy as np
+            lons, lats = decode_polyline6(geometry)
+            route['geometry'] = {
+                'coordinates': np.column_stack((lons, lats)).tolist(),
+                'type': 'LineString'
+            }
+
+    return route_data
+
+def _point_near_polyline(lat, lon, node_coords, buffer, lon_scale):
+    """
+    True when (lat, lon) lies within ~buffer degrees of any *segment* of
+    the way's polyline. Checking segments rather than vertices matters on
+    straight roads, where consecutive OSM nodes can sit hundreds of
+    meters apart with the carriageway running between them. Longitudes
+    are scaled by cos(mean latitude) so the threshold means the same
+    ground distance in both axes.
+    """
+    px, py = lon * lon_scale, lat
+    buffer_sq = buffer * buffer
+
+    prev_x = prev_y = None
+    for node_lat, node_lon in node_coords:
+        x, y = node_lon * lon_scale, node_lat
+        if prev_x is None:
+            # Degenerate single-node ways reduce to a vertex check
+            if len(node_coords) == 1:
+                dx, dy = px - x, py - y
+                return dx * dx + dy * dy <= buffer_sq
+        else:
+            dx, dy = x - prev_x, y - prev_y
+            seg_sq = dx * dx + dy * dy
+            if seg_sq == 0.0:
+                t = 0.0
+            else:
+                t = (px - prev_x) * dx + (py - prev_y) * dy
+                t = 0.0 if t < 0.0 else (1.0 if t > seg_sq else t / seg_sq)
+            ddx = px - (prev_x + t * dx)
+            ddy = py - (prev_y + t * dy)
+            if ddx * ddx + ddy * ddy <= buffer_sq:
+                return True
+        prev_x, prev_y = x, y
+
+    return False
+
+
+def _rdp_indices(coordinates, tolerance):
+    """
+    Indices kept by Ramer-Douglas-Peucker simplification of a polyline.
+
+    Straight stretches collapse to their endpoints while curves keep
+    their vertices, so sampling the survivors covers the route's shape
+    with far fewer points than a fixed stride. Iterative (explicit
+    stack) to stay clear of recursion limits on long routes.
+    """
+    if len(coordinates) < 3:
+        return list(range(len(coordinates)))
+
+    keep = {0, len(coordinates) - 1}
+    stack = [(0, len(coordinates) - 1)]
+    while stack:
+        start, end = stack.pop()
+        x1, y1 = coordinates[start][0], coordinates[start][1]
+        x2, y2 = coordinates[end][0], coordinates[end][1]
+        dx, dy = x2 - x1, y2 - y1
+        norm = math.hypot(dx, dy)
+
+        max_dist = 0.0
+        max_index = -1
+        for i in range(start + 1, end):
+            x0, y0 = coordinates[i][0], coordinates[i][1]
+            if norm == 0.0:
+                dist = math.hypot(x0 - x1, y0 - y1)
+            else:
+                dist = abs(dy * x0 - dx * y0 + x2 * y1 - y2 * x1) / norm
+            if dist > max_dist:
+                max_dist = dist
+                max_index = i
+
+        if max_dist > tolerance:
+            keep.add(max_index)
+            stack.append((start, max_index))
+            stack.append((max_index, end))
+
+    return sorted(keep)
+
 
 system_prompt = '''
 You are a helpful assistant for processing OpenStreetMap data. 
@@ -36,21 +176,23 @@ Return a json object with the following structure:
 
 class PathAgent:
     def __init__(self):
-        self.api = overpy.Overpass()
+        self.api = overpy.Overpass(url=OVERPASS_URL)
+
+        # Highway geometry keyed by the bbox it was fetched for; a reroute
+        # loop checks near-identical areas several times per request, and
+        # any cached bbox that covers the new one answers locally
+        self._highway_geom_cache = {}
         
     def get_bike_friendly_route(self, start_lat, start_lon, end_lat, end_lon, avoid_highways=True, save_filename=None):
         """Get a bicycle-friendly route avoiding highways"""
         
-        if avoid_highways:
-            # Use bike-specific routing profile and exclude highways
-            osrm_url = f"http://localhost:5000/route/v1/bicycle/{start_lon},{start_lat};{end_lon},{end_lat}?overview=full&geometries=geojson"
-        else:
-            osrm_url = f"http://localhost:5000/route/v1/bicycle/{start_lon},{start_lat};{end_lon},{end_lat}?overview=full&geometries=geojson"
-        
         try:
-            response = requests.get(osrm_url)
-            route_data = response.json()
-            
+            # Bike-specific routing profile either way; memoized on rounded
+            # endpoints so repeated legs skip the OSRM round-trip entirely
+            route_data = _fetch_osrm_route(round(start_lat, 5), round(start_lon, 5),
+                                           round(end_lat, 5), round(end_lon, 5))
+
+
             # Convert to GeoJSON and save using utils only if filename provided
             if route_data and 'routes' in route_data and route_data['routes'] and save_filename:
                 self._save_route_as_geojson(route_data, save_filename)
@@ -60,39 +202,125 @@ class PathAgent:
             print(f"Error getting route: {e}")
             return None
     
-    def analyze_route_for_highways(self, coordinates, sample_every=20):
+    def _query_highway_at(self, lat, lon, point_index):
+        """Query Overpass around one sample point, returning the first
+        unwanted highway found there (or None)."""
+        # Small bounding box around coordinate
+        buffer = 0.001
+        query = f"""
+        [out:json][timeout:10];
+        (
+          way["highway"]({lat-buffer},{lon-buffer},{lat+buffer},{lon+buffer});
+        );
+        out tags;
+        """
+
+        try:
+            result = self.api.query(query)
+            for way in result.ways:
+                highway_type = way.tags.get('highway', 'unknown')
+                if highway_type in ['motorway', 'trunk', 'primary']:
+                    # One highway per sample point is enough
+                    return {
+                        'way_id': way.id,
+                        'name': way.tags.get('name', 'Unnamed'),
+                        'highway_type': highway_type,
+                        'coordinate': (lat, lon),
+                        'point_index': point_index
+                    }
+        except:
+            pass
+        return None
+
+    def analyze_route_for_highways(self, coordinates, sample_every=20, simplify_tolerance=0.0002):
         """Check if route contains highways or unwanted road types"""
-        highways_found = []
-        
-        for i, coord in enumerate(coordinates[::sample_every]):
-            lon, lat = coord[0], coord[1]
-            
-            # Small bounding box around coordinate
-            buffer = 0.001
+        # Sample at the vertices that survive Douglas-Peucker rather than
+        # a fixed stride: straight segments contribute two points however
+        # long they are, curves keep their detail (~0.0002 deg is ~20m)
+        sample_indices = _rdp_indices(coordinates, simplify_tolerance)
+        samples = [(coordinates[i][1], coordinates[i][0], i) for i in sample_indices]
+        if not samples:
+            return []
+
+        # One Overpass query over the route's bounding box replaces a
+        # round-trip per sample point; matching back to sample points
+        # happens locally against the returned way geometry
+        buffer = 0.001
+        south = min(lat for lat, _, _ in samples) - buffer
+        north = max(lat for lat, _, _ in samples) + buffer
+        west = min(lon for _, lon, _ in samples) - buffer
+        east = max(lon for _, lon, _ in samples) + buffer
+
+        # A previously fetched highway set whose bbox covers this one can
+        # answer without touching Overpass; reroute attempts always land in
+        # roughly the same area, so this short-circuits most of the loop
+        way_geometries = None
+        for (cached_s, cached_w, cached_n, cached_e), cached_ways in self._highway_geom_cache.items():
+            if cached_s <= south and cached_w <= west and cached_n >= north and cached_e >= east:
+                way_geometries = cached_ways
+                break
+
+        if way_geometries is None:
+            # Pad the query bbox (~1km) so detour-waypoint variants of this
+            # route still fall inside the cached area
+            pad = 0.01
+            query_s, query_w = south - pad, west - pad
+            query_n, query_e = north + pad, east + pad
+
             query = f"""
-            [out:json][timeout:10];
+            [out:json][timeout:25];
             (
-              way["highway"]({lat-buffer},{lon-buffer},{lat+buffer},{lon+buffer});
+              way["highway"~"^(motorway|trunk|primary)$"]({query_s},{query_w},{query_n},{query_e});
             );
-            out tags;
+            out geom;
+            >;
+            out skel qt;
             """
-            
+
             try:
                 result = self.api.query(query)
-                for way in result.ways:
-                    highway_type = way.tags.get('highway', 'unknown')
-                    if highway_type in ['motorway', 'trunk', 'primary']:
-                        highways_found.append({
-                            'way_id': way.id,
-                            'name': way.tags.get('name', 'Unnamed'),
-                            'highway_type': highway_type,
-                            'coordinate': (lat, lon),
-                            'point_index': i * sample_every
-                        })
-                        break  # One highway per sample point is enough
-            except:
-                continue
-        
+            except Exception as e:
+                # Corridor query failed; fall back to the per-point scan,
+                # overlapped across a bounded pool since each is independent
+                print(f"⚠️  Corridor highway query failed ({e}), falling back to per-point queries")
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    results = executor.map(lambda args: self._query_highway_at(*args), samples)
+                return [hit for hit in results if hit]
+
+            way_geometries = []
+            for way in result.ways:
+                node_coords = [(float(node.lat), float(node.lon)) for node in way.nodes
+                               if node.lat is not None and node.lon is not None]
+                if node_coords:
+                    way_geometries.append((way, node_coords))
+
+            if len(self._highway_geom_cache) >= 8:
+                self._highway_geom_cache.pop(next(iter(self._highway_geom_cache)))
+            self._highway_geom_cache[(query_s, query_w, query_n, query_e)] = way_geometries
+
+        # A highway-free area stays highway-free for every sample point
+        if not way_geometries:
+            return []
+
+        # Intersect sample points with way segments, not just vertices:
+        # a straight motorway with sparse nodes still has to be caught
+        # between them
+        lon_scale = math.cos(math.radians((south + north) / 2.0))
+
+        highways_found = []
+        for lat, lon, point_index in samples:
+            for way, node_coords in way_geometries:
+                if _point_near_polyline(lat, lon, node_coords, buffer, lon_scale):
+                    # One highway per sample point is enough
+                    highways_found.append({
+                        'way_id': way.id,
+                        'name': way.tags.get('name', 'Unnamed'),
+                        'highway_type': way.tags.get('highway', 'unknown'),
+                        'coordinate': (lat, lon),
+                        'point_index': point_index
+                    })
+                    break
+
         return highways_found
     
     def create_detour_waypoints(self, start_lat, start_lon, end_lat, end_lon, highways_to_avoid):
@@ -127,13 +355,10 @@ class PathAgent:
         if len(waypoints) < 2:
             return None
         
-        # Format waypoints for OSRM
-        coord_string = ";".join([f"{lon},{lat}" for lat, lon in waypoints])
-        osrm_url = f"http://localhost:5000/route/v1/bicycle/{coord_string}?overview=full&geometries=geojson"
-        
         try:
-            response = requests.get(osrm_url)
-            route_data = response.json()
+            # Single multi-waypoint OSRM request instead of one per pair
+            from utils import route_many
+            route_data = route_many(waypoints, base_url=OSRM_BASE)
             
             # Convert to GeoJSON and save using utils only if filename provided
             if route_data and 'routes' in route_data and route_data['routes'] and save_filename:
@@ -149,7 +374,8 @@ class PathAgent:
         
         print("🚴 Getting initial bicycle route...")
         route = self.get_bike_friendly_route(start_lat, start_lon, end_lat, end_lon, avoid_highways=True)
-        print(f"Initial route response: {route}")
+        if os.environ.get("DEBUG"):
+            print(f"Initial route response: {route}")
         if not route or 'routes' not in route or not route['routes']:
             print("❌ No initial route found")
             return None
@@ -211,6 +437,14 @@ class PathAgent:
         return route
 
     def _save_route_as_geojson(self, route, filename):
+        """Persist a route as GeoJSON in the background; the caller gets
+        its routing result back without waiting on disk. Anyone reading
+        the file back by path should call join_pending_write(filename)
+        first."""
+        _PENDING_WRITES[os.path.abspath(filename)] = _IO_POOL.submit(
+            self._write_route_geojson, route, filename)
+
+    def _write_route_geojson(self, route, filename):
         """Helper method to save route as GeoJSON"""
         try:
             if route and 'routes' in route and route['routes']:
@@ -219,10 +453,11 @@ class PathAgent:
                 # Convert to GeoJSON
                 geojson = osrm_route_to_geojson(route)
                 
-                # Save to specified filename
-                import json
-                with open(filename, 'w') as f:
-                    json.dump(geojson, f, indent=2)
+                # Save to specified filename; compact output (no indent)
+                # halves the bytes written for these internal files, and
+                # orjson's C encoder is far faster than json.dump
+                with open(filename, 'wb') as f:
+                    f.write(orjson.dumps(geojson))
                 
                 print(f"💾 Route saved to {filename}")
         except Exception as e:
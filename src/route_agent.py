@@ -1,10 +1,36 @@
-import json
+import gzip
+import logging
+import orjson
+import os
 import overpy
 import math
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from sys import intern
 from typing import List, Dict, Any, Tuple, Optional
-from utils import chat_with_openai
+from utils import (cached_overpass_query_raw, chat_with_openai, cumulative_distance_m,
+                   haversine_m, haversine_many_m, haversine_np, nearest_route_distance_m,
+                   EARTH_RADIUS_M, OVERPASS_URL)
 import dotenv
 
+# Tag keys that identify amenity elements when partitioning the combined
+# Overpass result (ways use the subset actually queried as ways)
+_AMENITY_NODE_KEYS = frozenset(('amenity', 'shop', 'tourism', 'leisure', 'natural', 'historic'))
+_AMENITY_WAY_KEYS = frozenset(('tourism', 'leisure', 'natural', 'historic'))
+
+# Concurrent Overpass fetches only help against self-hosted mirrors; the
+# public instance serves one request per IP at a time, hence the default
+OVERPASS_MAX_CONCURRENCY = int(os.environ.get("OVERPASS_MAX_CONCURRENCY", "1"))
+
+# Degrees-to-radians factor; a multiply is cheaper than a math.radians
+# call in the scalar haversine hot path
+_D2R = math.pi / 180.0
+
+# Progress chatter goes through a level-gated logger rather than stdout:
+# a long route used to emit thousands of line-buffered print flushes.
+# Run logging.basicConfig(level=logging.DEBUG) to get the verbose output
+logger = logging.getLogger("route_agent")
+
 
 class RouteAnalysisAgent:
     def __init__(self, openai_api_key: str):
@@ -15,7 +41,16 @@ class RouteAnalysisAgent:
             openai_api_key: Your OpenAI API key
         """
         self.openai_api_key = openai_api_key
-        self.overpass_api = overpy.Overpass()
+        self.overpass_api = overpy.Overpass(url=OVERPASS_URL)
+
+        # Per-file route context (coordinates + spatial index), derived
+        # once per file version and shared across analysis calls
+        self._route_ctx: Dict[str, Dict[str, Any]] = {}
+
+        # Static (anchor-independent) extraction results keyed by OSM id:
+        # overlapping chunk bboxes return the same elements several times,
+        # and tag parsing + string building only needs to happen once
+        self._extract_cache: Dict[Tuple[str, int], Dict[str, Any]] = {}
         
         self.system_prompt = """
         You are a helpful assistant that analyzes Points of Interest (POIs) and simple detour opportunities along bicycle and walking routes.
@@ -48,8 +83,13 @@ class RouteAnalysisAgent:
             List of (latitude, longitude) coordinate pairs
         """
         try:
-            with open(geojson_file, 'r') as f:
-                geojson = json.load(f)
+            # Sniff the extension so compressed routes load transparently
+            if geojson_file.endswith('.gz'):
+                with gzip.open(geojson_file, 'rb') as f:
+                    geojson = orjson.loads(f.read())
+            else:
+                with open(geojson_file, 'rb') as f:
+                    geojson = orjson.loads(f.read())
             
             if geojson['type'] == 'Feature':
                 coordinates = geojson['geometry']['coordinates']
@@ -63,32 +103,68 @@ class RouteAnalysisAgent:
             return [(coord[1], coord[0]) for coord in coordinates]
             
         except Exception as e:
-            print(f"❌ Error loading GeoJSON: {e}")
+            logger.error(f"Error loading GeoJSON: {e}")
             return []
     
-    def sample_route_coordinates(self, coordinates: List[Tuple[float, float]], 
+    def _route_context(self, geojson_file: str) -> Dict[str, Any]:
+        """
+        Return the cached {coordinates, index} context for a route file.
+
+        The loaded coordinate list and its kd-tree are the per-route setup
+        cost shared by every analysis/detour call; deriving them once per
+        file version (mtime-invalidated) means repeat calls with different
+        sampling parameters skip the file parse and index build.
+        """
+        try:
+            mtime_ns = os.stat(geojson_file).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+
+        cached = self._route_ctx.get(geojson_file)
+        if cached is not None and mtime_ns is not None and cached['mtime_ns'] == mtime_ns:
+            return cached
+
+        coordinates = self.load_geojson_route(geojson_file)
+        ctx = {
+            'mtime_ns': mtime_ns,
+            'coordinates': coordinates,
+            'index': self._build_route_index(coordinates) if coordinates else None,
+        }
+        if mtime_ns is not None:
+            if len(self._route_ctx) >= 8:
+                self._route_ctx.pop(next(iter(self._route_ctx)))
+            self._route_ctx[geojson_file] = ctx
+        return ctx
+
+    def sample_route_coordinates(self, coordinates: List[Tuple[float, float]],
                                 sample_distance_m: float = 200) -> List[Tuple[float, float]]:
         """
         Sample coordinates along the route at specified intervals.
         """
         if not coordinates:
             return []
-        
-        sampled = [coordinates[0]]  # Always include start
-        
-        for i in range(1, len(coordinates)):
-            last_sampled = sampled[-1]
-            current = coordinates[i]
-            
-            distance = self.haversine_distance(last_sampled, current) * 1000  # Convert to meters
-            
-            if distance >= sample_distance_m:
-                sampled.append(current)
-        
+        if len(coordinates) == 1:
+            return [coordinates[0]]
+
+        # One vectorized pass: cumulative along-route distance, then pick
+        # the first point at or past each multiple of sample_distance_m.
+        # Replaces the Python loop that did a haversine call per point.
+        coords = np.asarray(coordinates, dtype=np.float64)  # (lat, lon) rows
+        cum_dist = cumulative_distance_m(coords[:, 1], coords[:, 0])
+        targets = np.arange(0, cum_dist[-1], sample_distance_m)
+        indices = np.unique(np.searchsorted(cum_dist, targets))
+
+        # Zero-length route (all points identical): no targets to sample,
+        # return the start point like the pre-vectorized loop did
+        if indices.size == 0:
+            return [coordinates[0]]
+
+        sampled = [coordinates[i] for i in indices]
+
         # Always include end if it's not already sampled
-        if coordinates[-1] not in sampled:
+        if indices[-1] != len(coordinates) - 1:
             sampled.append(coordinates[-1])
-        
+
         return sampled
     
     def haversine_distance(self, coord1: Tuple[float, float], coord2: Tuple[float, float]) -> float:
@@ -97,205 +173,496 @@ class RouteAnalysisAgent:
         """
         lat1, lon1 = coord1
         lat2, lon2 = coord2
-        
-        # Convert to radians
-        lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-        
-        # Haversine formula
+
+        # Convert to radians: inline multiplies instead of four
+        # math.radians call dispatches
+        lat1 *= _D2R
+        lat2 *= _D2R
+
+        # Haversine formula, atan2 form: numerically robust for
+        # near-antipodal points and no costlier than asin
         dlat = lat2 - lat1
-        dlon = lon2 - lon1
+        dlon = (lon2 - lon1) * _D2R
         a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        r = 6371  # Radius of earth in kilometers
-        
-        return c * r
+        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1.0 - a))
+
+        return c * (EARTH_RADIUS_M / 1000.0)
+
+    def _combined_query(self, south: float, west: float, north: float, east: float) -> str:
+        """Build the single query covering amenities and detour ways.
+
+        Merging both element groups into one union halves the Overpass
+        round trips; the result is partitioned client-side by tags in
+        _query_area. Coordinates are quantized to 5 decimals (~1 m) so
+        near-identical bboxes template into byte-identical queries and
+        share a cache line in the on-disk Overpass cache.
+        """
+        bbox = f"{south:.5f},{west:.5f},{north:.5f},{east:.5f}"
+        return f"""
+        [out:json][timeout:25];
+        (
+        node["amenity"~"^(restaurant|cafe|fast_food|pub|bar|fuel|bank|atm|pharmacy|hospital|toilets|drinking_water|bicycle_parking|bicycle_rental|bicycle_repair_station|water_point|fountain|bench|shelter|waste_basket|recycling)$"]({bbox});
+        node["shop"~"^(convenience|supermarket|bicycle|sports|outdoor|hardware|general|department_store|mall|bakery|butcher|greengrocer|alcohol|beverage)$"]({bbox});
+        node["tourism"~"^(information|viewpoint|attraction|museum|gallery|artwork|picnic_site)$"]({bbox});
+        node["leisure"~"^(park|playground|fitness_station|sports_centre|swimming_pool|golf_course|nature_reserve|garden|common|recreation_ground|pitch)$"]({bbox});
+        node["natural"~"^(peak|viewpoint|spring|waterfall|beach|cliff|cave_entrance)$"]({bbox});
+        node["historic"~"^(monument|memorial|castle|ruins|archaeological_site|wayside_cross|wayside_shrine)$"]({bbox});
+        way["tourism"~"^(information|viewpoint|attraction|museum|gallery|artwork|picnic_site)$"]({bbox});
+        way["leisure"~"^(park|playground|fitness_station|sports_centre|swimming_pool|golf_course|nature_reserve|garden|common|recreation_ground|pitch)$"]({bbox});
+        way["natural"~"^(peak|viewpoint|spring|waterfall|beach|cliff|cave_entrance)$"]({bbox});
+        way["historic"~"^(monument|memorial|castle|ruins|archaeological_site|wayside_cross|wayside_shrine)$"]({bbox});
+        way["highway"="cycleway"]({bbox});
+        way["highway"="path"]["bicycle"~"^(yes|designated)$"]({bbox});
+        way["highway"="footway"]["bicycle"="yes"]({bbox});
+        way["highway"="pedestrian"]({bbox});
+        way["highway"="track"]({bbox});
+        way["highway"="service"]({bbox});
+        way["cycleway"]({bbox});
+        way["bicycle"="designated"]({bbox});
+        way["highway"="residential"]["traffic_calming"]({bbox});
+        way["highway"="living_street"]({bbox});
+        way["maxspeed"~"^(20|30)$"]({bbox});
+        way["highway"~"^(footway|path|residential|tertiary|secondary|unclassified)$"]({bbox});
+        );
+        out geom;
+        >;
+        out skel qt;
+        """
+
+    def _query_area(self, south: float, west: float, north: float, east: float):
+        """
+        Fetch one bbox with the combined query and partition the result.
+
+        Elements are kept as the plain dicts Overpass returns — building
+        the overpy Node/Way object graph allocates an instance per
+        element only for the extraction code to immediately flatten it
+        back into a dict, and accounts for a sizable share of parse time
+        on large responses. Ways carry their node coordinates in the
+        'geometry' key thanks to 'out geom'.
+
+        Ways with a highway/cycleway/bicycle/maxspeed tag came from the
+        detour selectors; ways with tourism/leisure/natural/historic tags
+        came from the amenity selectors (a way can match both, as it
+        could under the old two-query scheme). Untagged skeleton nodes
+        pulled in by the recursion are skipped.
+
+        Returns:
+            (amenity_nodes, amenity_ways, detour_ways) as element dicts
+        """
+        data = cached_overpass_query_raw(self._combined_query(south, west, north, east))
+
+        amenity_nodes = []
+        amenity_ways = []
+        detour_ways = []
+        for element in data.get('elements', ()):
+            tags = element.get('tags')
+            if not tags:
+                continue
+            if element.get('type') == 'node':
+                if not _AMENITY_NODE_KEYS.isdisjoint(tags):
+                    amenity_nodes.append(element)
+            elif element.get('type') == 'way':
+                if ('highway' in tags or 'cycleway' in tags
+                        or tags.get('bicycle') == 'designated'
+                        or tags.get('maxspeed') in ('20', '30')):
+                    detour_ways.append(element)
+                if not _AMENITY_WAY_KEYS.isdisjoint(tags):
+                    amenity_ways.append(element)
+
+        return amenity_nodes, amenity_ways, detour_ways
 
-    def find_detour_opportunities(self, lat: float, lon: float, 
-                        search_radius_m: float = 200) -> List[Dict[str, Any]]:
+    def _find_detours_batched(self, sampled_coords: List[Tuple[float, float]],
+                              search_radius_m: float,
+                              max_distance_m: Optional[float] = None,
+                              type_whitelist: Optional[set] = None,
+                              chunk_km: float = 5.0) -> List[List[Dict[str, Any]]]:
+        """
+        Find detour opportunities for all sample points with a few batched
+        Overpass requests instead of two per point.
+
+        Consecutive sample points are grouped into ~chunk_km spans of
+        route; each chunk issues one amenity query and one detour query
+        over its padded enclosing bbox, and every returned element is
+        assigned to its nearest sample point with a vectorized haversine
+        matrix. Overpass serves one request per IP at a time, so this
+        collapses 2xN round-trips into 2x(route_km / chunk_km) and is the
+        dominant wall-time saving on long routes. A chunk that fails
+        falls back to the per-point queries for its sample points.
+
+        Returns:
+            One detour list per sample point, parallel to sampled_coords
+        """
+        per_point_amenities: List[List[Dict[str, Any]]] = [[] for _ in sampled_coords]
+        per_point_ways: List[List[Dict[str, Any]]] = [[] for _ in sampled_coords]
+        if not sampled_coords:
+            return []
+
+        radius_deg = search_radius_m / 111000
+        pts = np.asarray(sampled_coords, dtype=np.float64)  # (lat, lon) rows
+
+        # Elements land in the union of the per-point bboxes; the corner
+        # of a bbox is sqrt(2) x the radius away from its sample point
+        accept_radius_m = search_radius_m * math.sqrt(2.0)
+
+        def make_nearest_sample(chunk_pts):
+            """
+            Build the nearest-chunk-sample-point lookup for one chunk.
+
+            With scipy available this is a kd-tree over the chunk's sample
+            points in the same local equirectangular frame as the route
+            index — O(E log P) for E elements instead of an O(E x P) dense
+            distance matrix. Without scipy, the dense haversine matrix is
+            the fallback.
+            """
+            index = self._build_route_index(chunk_pts)
+
+            def nearest_sample(el_lats, el_lons):
+                el_lats = np.asarray(el_lats, dtype=np.float64)
+                el_lons = np.asarray(el_lons, dtype=np.float64)
+                if index is not None:
+                    tree, lat0_cos = index
+                    query_xy = np.c_[np.radians(el_lons) * lat0_cos,
+                                     np.radians(el_lats)] * EARTH_RADIUS_M
+                    d, j = tree.query(query_xy, k=1)
+                    return j, d
+                d = haversine_np(el_lats[:, None], el_lons[:, None],
+                                 chunk_pts[None, :, 0], chunk_pts[None, :, 1])
+                j = np.argmin(d, axis=1)
+                return j, d[np.arange(len(j)), j]
+
+            return nearest_sample
+
+        # Group consecutive sample points into ~chunk_km spans of route
+        # to stay under Overpass's area limits on long routes
+        cum = cumulative_distance_m(pts[:, 1], pts[:, 0])
+        chunk_ids = (cum // (chunk_km * 1000)).astype(np.int64)
+
+        def accepts(info):
+            if max_distance_m is not None and info['distance_from_route_m'] > max_distance_m:
+                return False
+            if type_whitelist is not None and info['type'].rpartition('=')[2] not in type_whitelist:
+                return False
+            return True
+
+        chunks = []
+        for chunk_id in np.unique(chunk_ids):
+            idx = np.nonzero(chunk_ids == chunk_id)[0]
+            chunk_pts = pts[idx]
+            bbox = (chunk_pts[:, 0].min() - radius_deg, chunk_pts[:, 1].min() - radius_deg,
+                    chunk_pts[:, 0].max() + radius_deg, chunk_pts[:, 1].max() + radius_deg)
+            chunks.append((idx, chunk_pts, bbox))
+
+        def fetch(bbox):
+            try:
+                return self._query_area(*bbox)
+            except Exception as e:
+                return e
+
+        # The public Overpass instance serves one request per IP at a
+        # time, so chunk fetches run serially by default; point
+        # OVERPASS_URL at a self-hosted mirror and raise
+        # OVERPASS_MAX_CONCURRENCY to overlap the network waits
+        max_workers = min(OVERPASS_MAX_CONCURRENCY, len(chunks))
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                fetched = list(pool.map(fetch, [chunk[2] for chunk in chunks]))
+        else:
+            fetched = None
+
+        for n, (idx, chunk_pts, bbox) in enumerate(chunks):
+            south, west, north, east = bbox
+            logger.debug(f"Processing OSM chunk of {len(idx)} sample points: "
+                  f"{south:.5f},{west:.5f},{north:.5f},{east:.5f}")
+            result = fetched[n] if fetched is not None else fetch(bbox)
+            if isinstance(result, Exception):
+                logger.warning(f"Batched query failed for chunk ({result}), falling back to per-point queries")
+                for i in idx:
+                    # Already ordered amenities-first; keep it intact
+                    per_point_ways[i] = self.find_detour_opportunities(
+                        pts[i][0], pts[i][1], search_radius_m,
+                        max_distance_m=max_distance_m, type_whitelist=type_whitelist)
+                continue
+
+            amenity_nodes, amenity_ways, detour_ways = result
+            nearest_sample = make_nearest_sample(chunk_pts)
+
+            # Amenity nodes: one distance matrix against the chunk's
+            # sample points assigns each node to its nearest point
+            located_nodes = [
+                node for node in amenity_nodes
+                if node.get('lat') is not None and node.get('lon') is not None
+            ]
+            if located_nodes:
+                j, dist = nearest_sample([n['lat'] for n in located_nodes],
+                                         [n['lon'] for n in located_nodes])
+                for node, sample_j, distance_m in zip(located_nodes, j, dist):
+                    if distance_m > accept_radius_m:
+                        continue
+                    plat, plon = chunk_pts[sample_j]
+                    info = self.extract_amenity_info(node, plat, plon, distance_m=distance_m)
+                    if info and accepts(info):
+                        per_point_amenities[idx[sample_j]].append(
+                            self.create_amenity_detour(info, plat, plon))
+
+            # Amenity ways: extract once, then reassign to the nearest
+            # sample point using the way's centroid
+            for way in amenity_ways:
+                try:
+                    info = self.extract_amenity_way_info(way, chunk_pts[0][0], chunk_pts[0][1])
+                except Exception as e:
+                    logger.warning(f"Failed to process amenity way {getattr(way, 'id', 'unknown')}: {e}")
+                    continue
+                if info is None:
+                    continue
+                j, dist = nearest_sample([info['location'][0]], [info['location'][1]])
+                if dist[0] > accept_radius_m:
+                    continue
+                info['distance_from_route_m'] = round(float(dist[0]), 1)
+                if accepts(info):
+                    plat, plon = chunk_pts[j[0]]
+                    per_point_amenities[idx[j[0]]].append(
+                        self.create_amenity_detour(info, plat, plon))
+
+            # Detour ways: assign by middle node
+            way_infos = [info for info in (self.extract_simple_way_info(way)
+                                           for way in detour_ways) if info]
+            if way_infos:
+                j, dist = nearest_sample([w['middle_node']['lat'] for w in way_infos],
+                                         [w['middle_node']['lon'] for w in way_infos])
+                for way_info, sample_j, distance_m in zip(way_infos, j, dist):
+                    if distance_m > accept_radius_m:
+                        continue
+                    plat, plon = chunk_pts[sample_j]
+                    way_info['distance_from_route_m'] = round(float(distance_m), 1)
+                    per_point_ways[idx[sample_j]].append(
+                        self.create_simple_way_detour(way_info, plat, plon))
+
+        # Preserve find_detour_opportunities' ordering contract: amenities
+        # nearest-first, then ways
+        per_point = []
+        for amenities, ways in zip(per_point_amenities, per_point_ways):
+            amenities.sort(key=lambda d: d['detour_distance_m'])
+            per_point.append(amenities + ways)
+        return per_point
+
+    def find_detour_opportunities(self, lat: float, lon: float,
+                        search_radius_m: float = 200,
+                        max_distance_m: Optional[float] = None,
+                        type_whitelist: Optional[set] = None) -> List[Dict[str, Any]]:
         """
         Find amenities and nearby ways near a coordinate.
-        
+
         Args:
             lat: Latitude
             lon: Longitude
             search_radius_m: Search radius in meters
-            
+            max_distance_m: Drop amenities farther than this from the point;
+                applied as soon as the distance is computed so rejected
+                entries are never materialized in the result
+            type_whitelist: If given, keep only amenities whose tag value
+                (the part after '=') is in this set
+
         Returns:
             List of detour opportunities (amenities + ways)
         """
         # Convert radius to degrees
         radius_deg = search_radius_m / 111000
-        
+
         south = lat - radius_deg
         north = lat + radius_deg
         west = lon - radius_deg
         east = lon + radius_deg
-        
-        # Query for amenities - NODES AND WAYS with complete geometry
-        amenity_query = f"""
-        [out:json][timeout:25];
-        (
-        node["amenity"~"^(restaurant|cafe|fast_food|pub|bar|fuel|bank|atm|pharmacy|hospital|toilets|drinking_water|bicycle_parking|bicycle_rental|bicycle_repair_station|water_point|fountain|bench|shelter|waste_basket|recycling)$"]({south},{west},{north},{east});
-        node["shop"~"^(convenience|supermarket|bicycle|sports|outdoor|hardware|general|department_store|mall|bakery|butcher|greengrocer|alcohol|beverage)$"]({south},{west},{north},{east});
-        node["tourism"~"^(information|viewpoint|attraction|museum|gallery|artwork|picnic_site)$"]({south},{west},{north},{east});
-        node["leisure"~"^(park|playground|fitness_station|sports_centre|swimming_pool|golf_course|nature_reserve|garden|common|recreation_ground|pitch)$"]({south},{west},{north},{east});
-        node["natural"~"^(peak|viewpoint|spring|waterfall|beach|cliff|cave_entrance)$"]({south},{west},{north},{east});
-        node["historic"~"^(monument|memorial|castle|ruins|archaeological_site|wayside_cross|wayside_shrine)$"]({south},{west},{north},{east});
-        way["tourism"~"^(information|viewpoint|attraction|museum|gallery|artwork|picnic_site)$"]({south},{west},{north},{east});
-        way["leisure"~"^(park|playground|fitness_station|sports_centre|swimming_pool|golf_course|nature_reserve|garden|common|recreation_ground|pitch)$"]({south},{west},{north},{east});
-        way["natural"~"^(peak|viewpoint|spring|waterfall|beach|cliff|cave_entrance)$"]({south},{west},{north},{east});
-        way["historic"~"^(monument|memorial|castle|ruins|archaeological_site|wayside_cross|wayside_shrine)$"]({south},{west},{north},{east});
-        );
-        out geom;
-        >;
-        out skel qt;
-        """
-        
-        # Query for detour ways
-        detour_query = f"""
-        [out:json][timeout:25];
-        (
-            way["highway"="cycleway"]({south},{west},{north},{east});
-            way["highway"="path"]["bicycle"~"^(yes|designated)$"]({south},{west},{north},{east});
-            way["highway"="footway"]["bicycle"="yes"]({south},{west},{north},{east});
-            way["highway"="pedestrian"]({south},{west},{north},{east});
-            way["highway"="track"]({south},{west},{north},{east});
-            way["highway"="service"]({south},{west},{north},{east});
-            way["cycleway"]({south},{west},{north},{east});
-            way["bicycle"="designated"]({south},{west},{north},{east});
-
-            way["highway"="residential"]["traffic_calming"]({south},{west},{north},{east});
-            way["highway"="living_street"]({south},{west},{north},{east});
-            way["maxspeed"~"^(20|30)$"]({south},{west},{north},{east});
-
-            way["highway"~"^(footway|path|residential|tertiary|secondary|unclassified)$"]({south},{west},{north},{east});
-        );
-        out geom;
-        >;
-        out;
-        """
-        
+
         try:
-            print(f"🔍 Querying OSM for area: {south:.5f},{west:.5f},{north:.5f},{east:.5f}")
-            
-            # Execute amenity query
-            print("🏪 Querying amenities...")
-            amenity_result = self.overpass_api.query(amenity_query)
-            print(f"✅ Found {len(amenity_result.nodes)} amenity nodes")
-            
-            # Execute detour query
-            print("🛣️  Querying detour ways...")
-            detour_result = self.overpass_api.query(detour_query)
-            print(f"✅ Found {len(detour_result.ways)} detour ways")
-            
+            logger.debug(f"Querying OSM for area: {south:.5f},{west:.5f},{north:.5f},{east:.5f}")
+
+            # Single combined query for amenities + detour ways
+            amenity_nodes, amenity_ways, detour_ways = self._query_area(south, west, north, east)
+            logger.debug(f"Found {len(amenity_nodes)} amenity nodes, {len(detour_ways)} detour ways")
+
             # Debug: Check if ways have proper geometry
-            ways_with_geom = sum(1 for way in detour_result.ways if hasattr(way, 'nodes') and way.nodes)
-            ways_without_geom = len(detour_result.ways) - ways_with_geom
-            print(f"📊 Detour ways with geometry: {ways_with_geom}, without geometry: {ways_without_geom}")
+            ways_with_geom = sum(1 for way in detour_ways if way.get('geometry'))
+            ways_without_geom = len(detour_ways) - ways_with_geom
+            logger.debug(f"Detour ways with geometry: {ways_with_geom}, without geometry: {ways_without_geom}")
             
-            # Process amenity nodes
+            # Filter applied at the point the distance is known, so data the
+            # caller would discard never makes it into the payload
+            def accepts(info):
+                if max_distance_m is not None and info['distance_from_route_m'] > max_distance_m:
+                    return False
+                if type_whitelist is not None and info['type'].rpartition('=')[2] not in type_whitelist:
+                    return False
+                return True
+
+            # Process amenity nodes. Distances are computed for all nodes in
+            # one vectorized haversine pass instead of per-node math calls
             amenities = []
-            for node in amenity_result.nodes:
-                amenity_info = self.extract_amenity_info(node, lat, lon)
-                if amenity_info:
-                    amenities.append(amenity_info)
+            located_nodes = [
+                node for node in amenity_nodes
+                if node.get('lat') is not None and node.get('lon') is not None
+            ]
+            if located_nodes:
+                node_lats = np.array([node['lat'] for node in located_nodes])
+                node_lons = np.array([node['lon'] for node in located_nodes])
+                node_distances = haversine_many_m(lat, lon, node_lats, node_lons)
+                for node, distance_m in zip(located_nodes, node_distances):
+                    amenity_info = self.extract_amenity_info(node, lat, lon, distance_m=distance_m)
+                    if amenity_info and accepts(amenity_info):
+                        amenities.append(amenity_info)
 
             # Process amenity ways with error handling
             amenity_ways_processed = 0
             amenity_ways_failed = 0
 
-            for way in amenity_result.ways:
+            for way in amenity_ways:
                 try:
                     amenity_info = self.extract_amenity_way_info(way, lat, lon)
-                    if amenity_info:
+                    if amenity_info is None:
+                        amenity_ways_failed += 1
+                    elif accepts(amenity_info):
                         amenities.append(amenity_info)
                         amenity_ways_processed += 1
-                    else:
-                        amenity_ways_failed += 1
                 except Exception as e:
                     amenity_ways_failed += 1
-                    print(f"⚠️  Failed to process amenity way {getattr(way, 'id', 'unknown')}: {e}")
+                    logger.warning(f"Failed to process amenity way {getattr(way, 'id', 'unknown')}: {e}")
 
-            print(f"📊 Processed: {len(amenities)} total amenities")
-            print(f"📊 Amenity ways: {amenity_ways_processed} successful, {amenity_ways_failed} failed")
+            logger.debug(f"Processed: {len(amenities)} total amenities")
+            logger.debug(f"Amenity ways: {amenity_ways_processed} successful, {amenity_ways_failed} failed")
             
             # Process detour ways - extract just ID and middle node
             all_ways = []
             regular_ways_processed = 0
             regular_ways_failed = 0
             
-            for way in detour_result.ways:
+            for way in detour_ways:
                 way_info = self.extract_simple_way_info(way)
                 if way_info:
                     all_ways.append(way_info)
                     regular_ways_processed += 1
                 else:
                     regular_ways_failed += 1
-                    print(f"⚠️  Failed to extract info for way {way.id} ({way.tags.get('highway', 'unknown')})")
+                    logger.warning(f"Failed to extract info for way {way.get('id', 'unknown')} ({way.get('tags', {}).get('highway', 'unknown')})")
             
-            print(f"📊 Processed: {len(amenities)} amenities")
-            print(f"📊 Regular ways: {regular_ways_processed} successful, {regular_ways_failed} failed")
+            logger.debug(f"Processed: {len(amenities)} amenities")
+            logger.debug(f"Regular ways: {regular_ways_processed} successful, {regular_ways_failed} failed")
             
             # Create detour opportunities
             detour_opportunities = []
             
-            # Add amenity-based detours
+            # Add amenity-based detours, nearest first: downstream filters
+            # apply a distance cutoff and can stop scanning at the first
+            # amenity beyond it instead of testing every entry
+            amenities.sort(key=lambda a: a['distance_from_route_m'])
             for amenity in amenities:
                 detour = self.create_amenity_detour(amenity, lat, lon)
                 detour_opportunities.append(detour)
             
-            # Add ways as potential detours
-            for way in all_ways:
-                way_detour = self.create_simple_way_detour(way, lat, lon)
-                detour_opportunities.append(way_detour)
+            # Add ways as potential detours: middle-node distances in one
+            # anchored vectorized pass, so the builder does no trig
+            if all_ways:
+                way_distances = haversine_many_m(lat, lon,
+                                                 [w['middle_node']['lat'] for w in all_ways],
+                                                 [w['middle_node']['lon'] for w in all_ways])
+                for way, distance_m in zip(all_ways, way_distances):
+                    way['distance_from_route_m'] = round(float(distance_m), 1)
+                    way_detour = self.create_simple_way_detour(way, lat, lon)
+                    detour_opportunities.append(way_detour)
             
-            print(f"📊 Created {len(detour_opportunities)} detour opportunities")
+            logger.debug(f"Created {len(detour_opportunities)} detour opportunities")
             
             return detour_opportunities
             
         except Exception as e:
-            print(f"⚠️  Error finding detour opportunities near ({lat:.5f}, {lon:.5f}): {e}")
+            logger.warning(f"Error finding detour opportunities near ({lat:.5f}, {lon:.5f}): {e}")
             return []
     
-    def extract_simple_way_info(self, way) -> Optional[Dict[str, Any]]:
-        """Extract simple information about a way (just ID and middle node for detour routing)."""
+    def _cache_static(self, key, static):
+        """
+        Memoize the anchor-independent part of an extracted element.
+
+        Bounded so a very long route cannot grow the cache without limit;
+        on overflow the whole cache is dropped (cheap, and extraction is
+        only a parse away).
+        """
+        if len(self._extract_cache) >= 50_000:
+            self._extract_cache.clear()
+        self._extract_cache[key] = static
+
+    def _build_route_index(self, coordinates):
+        """
+        Build a kd-tree over route points in a local equirectangular frame.
+
+        City-scale spans are small enough that Euclidean distance in this
+        frame tracks haversine closely, so nearest-route-point lookups drop
+        from O(N) scans to O(log N) tree queries. Returns None when scipy
+        is unavailable; callers fall back to sample-point distances.
+        """
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            return None
+
+        coords = np.asarray(coordinates, dtype=np.float64)  # (lat, lon) pairs
+        lat0_cos = math.cos(math.radians(coords[:, 0].mean()))
+        xy = np.c_[np.radians(coords[:, 1]) * lat0_cos,
+                   np.radians(coords[:, 0])] * EARTH_RADIUS_M
+        return cKDTree(xy), lat0_cos
+
+    def _refine_distances_to_route(self, route_index, amenity_detours):
+        """
+        Replace each amenity's sample-point distance with its true distance
+        to the nearest route point, in one batched kd-tree query.
+        """
+        tree, lat0_cos = route_index
+        locations = np.array([d['amenity']['location'] for d in amenity_detours])  # (lat, lon)
+        query_xy = np.c_[np.radians(locations[:, 1]) * lat0_cos,
+                         np.radians(locations[:, 0])] * EARTH_RADIUS_M
+        distances, _ = tree.query(query_xy, k=1)
+
+        for detour, distance in zip(amenity_detours, distances):
+            distance = round(float(distance), 1)
+            detour['amenity']['distance_from_route_m'] = distance
+            detour['detour_distance_m'] = distance
+
+    def extract_simple_way_info(self, way: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Extract simple information about a way element dict (just ID and middle node for detour routing)."""
         try:
-            # Check if way has node references
-            if not hasattr(way, 'nodes') or not way.nodes:
+            # Overlapping bboxes return the same way repeatedly; reuse
+            # the parsed record and only hand out a fresh copy (callers
+            # attach per-anchor distances to it)
+            static = self._extract_cache.get(('simple_way', way.get('id')))
+            if static is not None:
+                return dict(static)
+
+            # 'out geom' puts resolved node coordinates on the way itself
+            geometry = way.get('geometry')
+            if not geometry:
                 return None
-            
-            # Find nodes with coordinates
-            valid_nodes = []
-            for node_ref in way.nodes:
-                lat_val = None
-                lon_val = None
-                
-                if hasattr(node_ref, 'lat') and node_ref.lat is not None:
-                    lat_val = float(node_ref.lat)
-                if hasattr(node_ref, 'lon') and node_ref.lon is not None:
-                    lon_val = float(node_ref.lon)
-                
-                if lat_val is not None and lon_val is not None:
-                    valid_nodes.append((lat_val, lon_val))
-    
+
+            # 'out geom' geometry entries always carry lat/lon; the
+            # surrounding except handles a malformed response
+            valid_nodes = [(point['lat'], point['lon']) for point in geometry]
+
             if len(valid_nodes) < 2:
                 return None
-            
+
             # Find middle node for routing purposes
             middle_index = len(valid_nodes) // 2
             middle_lat, middle_lon = valid_nodes[middle_index]
-            
+
             # Extract way tags
-            tags = way.tags
-            highway = tags.get('highway', 'unknown')
-            maxspeed = tags.get('maxspeed', '')
-            surface = tags.get('surface', '')
+            tags = way.get('tags', {})
+            # Interned: highway/surface/access values draw from a small
+            # OSM vocabulary repeated across every extracted way
+            highway = intern(tags.get('highway', 'unknown'))
+            maxspeed = intern(tags.get('maxspeed', ''))
+            surface = intern(tags.get('surface', ''))
             name = tags.get('name', '')
-            bicycle = tags.get('bicycle', '')
-            foot = tags.get('foot', '')
-            
-            return {
-                'id': way.id,
+            bicycle = intern(tags.get('bicycle', ''))
+            foot = intern(tags.get('foot', ''))
+
+            static = {
+                'id': way['id'],
                 'highway': highway,
                 'name': name,
                 'maxspeed': maxspeed,
@@ -307,156 +674,162 @@ class RouteAnalysisAgent:
                     'lon': middle_lon
                 },
                 'node_count': len(valid_nodes),
-                'osm_link': f"https://openstreetmap.org/way/{way.id}"
+                'osm_link': f"https://openstreetmap.org/way/{way['id']}"
             }
-        
+            self._cache_static(('simple_way', way['id']), static)
+            return dict(static)
+
         except Exception as e:
-            print(f"⚠️  Error extracting simple way info for way {getattr(way, 'id', 'unknown')}: {e}")
+            logger.warning(f"Error extracting simple way info for way {way.get('id', 'unknown')}: {e}")
             return None
     
     # ...existing code...
-    def extract_amenity_info(self, node, route_lat: float, route_lon: float) -> Optional[Dict[str, Any]]:
-        """Extract information about an amenity node."""
+    def extract_amenity_info(self, node: Dict[str, Any], route_lat: float, route_lon: float,
+                             distance_m: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Extract information about an amenity node element dict.
+
+        distance_m lets callers that batch-computed distances (one
+        vectorized pass over the whole result set) skip the per-node
+        haversine here.
+        """
         try:
-            if not (hasattr(node, 'lat') and hasattr(node, 'lon') and 
-                   node.lat is not None and node.lon is not None):
+            amenity_lat = node.get('lat')
+            amenity_lon = node.get('lon')
+            if amenity_lat is None or amenity_lon is None:
                 return None
-                
-            amenity_lat = float(node.lat)
-            amenity_lon = float(node.lon)
-            
+
             # Calculate distance from route point
-            distance = self.haversine_distance((route_lat, route_lon), (amenity_lat, amenity_lon)) * 1000
-            
-            tags = node.tags
-            
-            # Determine amenity type
-            amenity_type = "unknown"
-            category = "other"
-            
-            for key, value in tags.items():
-                if key in ['amenity', 'shop', 'tourism']:
-                    amenity_type = f"{key}={value}"
-                    category = key
-                    break
-            
-            name = tags.get('name', f"Unnamed {amenity_type}")
-            brand = tags.get('brand', '')
-            opening_hours = tags.get('opening_hours', '')
-            
-            return {
-                'id': node.id,
-                'name': name,
-                'type': amenity_type,
-                'category': category,
-                'brand': brand,
-                'opening_hours': opening_hours,
-                'location': (amenity_lat, amenity_lon),
-                'distance_from_route_m': round(distance, 1),
-                'osm_link': f"https://openstreetmap.org/node/{node.id}"
-            }
-        
+            if distance_m is not None:
+                distance = float(distance_m)
+            else:
+                distance = haversine_m(route_lat, route_lon, amenity_lat, amenity_lon)
+
+            # Tag parsing is anchor-independent; reuse it when the same
+            # node shows up in several overlapping bboxes
+            static = self._extract_cache.get(('node', node['id']))
+            if static is None:
+                tags = node.get('tags', {})
+
+                # Determine amenity type: O(1) dict probes over the three
+                # keys of interest instead of scanning every tag
+                amenity_type = "unknown"
+                category = "other"
+
+                for key in ('amenity', 'shop', 'tourism'):
+                    value = tags.get(key)
+                    if value is not None:
+                        # Interned: the same handful of type strings
+                        # repeats across thousands of extracted records
+                        amenity_type = intern(f"{key}={value}")
+                        category = key
+                        break
+
+                static = {
+                    'id': node['id'],
+                    'name': tags.get('name', f"Unnamed {amenity_type}"),
+                    'type': amenity_type,
+                    'category': category,
+                    'brand': tags.get('brand', ''),
+                    'opening_hours': tags.get('opening_hours', ''),
+                    'location': (amenity_lat, amenity_lon),
+                    'osm_link': f"https://openstreetmap.org/node/{node['id']}"
+                }
+                self._cache_static(('node', node['id']), static)
+
+            info = dict(static)
+            info['distance_from_route_m'] = round(distance, 1)
+            return info
+
         except Exception as e:
-            print(f"⚠️  Error extracting amenity info: {e}")
+            logger.warning(f"Error extracting amenity info: {e}")
             return None
     
-    def extract_amenity_way_info(self, way, route_lat: float, route_lon: float) -> Optional[Dict[str, Any]]:
-        """Extract information about an amenity way (like parks, tourist attractions)."""
+    def extract_amenity_way_info(self, way: Dict[str, Any], route_lat: float,
+                                 route_lon: float) -> Optional[Dict[str, Any]]:
+        """Extract information about an amenity way element dict (like parks, tourist attractions)."""
         try:
-            # Check if way has node references
-            if not hasattr(way, 'nodes') or not way.nodes:
-                print(f"⚠️  Way {way.id} has no node references")
-                return None
-            
-            # Find nodes with coordinates from the resolved nodes
-            valid_nodes = []
-            for node_ref in way.nodes:
-                # The node_ref should have lat/lon if the query resolved properly
-                lat_val = None
-                lon_val = None
-                
-                if hasattr(node_ref, 'lat') and node_ref.lat is not None:
-                    lat_val = float(node_ref.lat)
-                if hasattr(node_ref, 'lon') and node_ref.lon is not None:
-                    lon_val = float(node_ref.lon)
-                
-                if lat_val is not None and lon_val is not None:
-                    valid_nodes.append((lat_val, lon_val))
+            # Geometry, centroid and tag parsing are anchor-independent;
+            # reuse them when the same way shows up in several bboxes
+            static = self._extract_cache.get(('way', way.get('id')))
+            if static is None:
+                # 'out geom' puts resolved node coordinates on the way itself
+                geometry = way.get('geometry')
+                if not geometry:
+                    logger.warning(f"Way {way.get('id', 'unknown')} has no geometry")
+                    return None
+
+                # 'out geom' geometry entries always carry lat/lon; the
+                # surrounding except handles a malformed response
+                valid_nodes = [(point['lat'], point['lon']) for point in geometry]
+
+                if len(valid_nodes) < 2:
+                    logger.warning(f"Way {way.get('id', 'unknown')} has insufficient valid nodes: {len(valid_nodes)}")
+                    return None
+
+                # Calculate center point of the way for distance calculation:
+                # one vectorized mean instead of two Python-level passes
+                # (park/attraction boundaries can run to hundreds of nodes)
+                centroid = np.asarray(valid_nodes, dtype=np.float64).mean(axis=0)
+                center_lat, center_lon = float(centroid[0]), float(centroid[1])
+
+                tags = way.get('tags', {})
+
+                # Determine amenity type and category
+                amenity_type = "unknown"
+                category = "other"
+
+                # Check different tag categories for ways: fixed probe order,
+                # no per-call dict rebuild
+                for key in ('tourism', 'leisure', 'natural', 'historic', 'amenity', 'shop'):
+                    value = tags.get(key)
+                    if value is not None:
+                        amenity_type = intern(f"{key}={value}")
+                        category = key
+                        break
+
+                # Add category-specific useful info for ways
+                additional_info = {}
+                if category == 'leisure':
+                    additional_info['park_type'] = tags.get('park:type', '')
+                    additional_info['access'] = tags.get('access', 'public')
+                    additional_info['sport'] = tags.get('sport', '')
+                elif category == 'natural':
+                    additional_info['elevation'] = tags.get('ele', '')
+                    additional_info['natural_type'] = tags.get('natural', '')
+                elif category == 'tourism':
+                    additional_info['tourism_type'] = tags.get('tourism', '')
+                    additional_info['wheelchair'] = tags.get('wheelchair', '')
+                elif category == 'historic':
+                    additional_info['historic_type'] = tags.get('historic', '')
+                    additional_info['heritage'] = tags.get('heritage', '')
+
+                static = {
+                    'id': way['id'],
+                    'name': tags.get('name', f"Unnamed {amenity_type}"),
+                    'type': amenity_type,
+                    'category': category,
+                    'brand': tags.get('brand', ''),
+                    'opening_hours': tags.get('opening_hours', ''),
+                    'website': tags.get('website', ''),
+                    'phone': tags.get('phone', ''),
+                    'additional_info': additional_info,
+                    'location': (center_lat, center_lon),
+                    'geometry_type': 'way',
+                    'node_count': len(valid_nodes),
+                    'osm_link': f"https://openstreetmap.org/way/{way['id']}"
+                }
+                self._cache_static(('way', way['id']), static)
+
+            # Distance from route point to the (cached) way centroid
+            center_lat, center_lon = static['location']
+            distance = haversine_m(route_lat, route_lon, center_lat, center_lon)
+
+            info = dict(static)
+            info['distance_from_route_m'] = round(distance, 1)
+            return info
 
-            if len(valid_nodes) < 2:
-                print(f"⚠️  Way {way.id} has insufficient valid nodes: {len(valid_nodes)}")
-                return None
-            
-            # Calculate center point of the way for distance calculation
-            center_lat = sum(coord[0] for coord in valid_nodes) / len(valid_nodes)
-            center_lon = sum(coord[1] for coord in valid_nodes) / len(valid_nodes)
-            
-            # Calculate distance from route point to center of way
-            distance = self.haversine_distance((route_lat, route_lon), (center_lat, center_lon)) * 1000
-            
-            tags = way.tags
-            
-            # Determine amenity type and category
-            amenity_type = "unknown"
-            category = "other"
-            
-            # Check different tag categories for ways
-            tag_categories = {
-                'tourism': 'tourism',
-                'leisure': 'leisure',
-                'natural': 'natural',
-                'historic': 'historic',
-                'amenity': 'amenity',
-                'shop': 'shop'
-            }
-            
-            for key, cat in tag_categories.items():
-                if key in tags:
-                    amenity_type = f"{key}={tags[key]}"
-                    category = cat
-                    break
-            
-            name = tags.get('name', f"Unnamed {amenity_type}")
-            brand = tags.get('brand', '')
-            opening_hours = tags.get('opening_hours', '')
-            website = tags.get('website', '')
-            phone = tags.get('phone', '')
-            
-            # Add category-specific useful info for ways
-            additional_info = {}
-            if category == 'leisure':
-                additional_info['park_type'] = tags.get('park:type', '')
-                additional_info['access'] = tags.get('access', 'public')
-                additional_info['sport'] = tags.get('sport', '')
-            elif category == 'natural':
-                additional_info['elevation'] = tags.get('ele', '')
-                additional_info['natural_type'] = tags.get('natural', '')
-            elif category == 'tourism':
-                additional_info['tourism_type'] = tags.get('tourism', '')
-                additional_info['wheelchair'] = tags.get('wheelchair', '')
-            elif category == 'historic':
-                additional_info['historic_type'] = tags.get('historic', '')
-                additional_info['heritage'] = tags.get('heritage', '')
-            
-            return {
-                'id': way.id,
-                'name': name,
-                'type': amenity_type,
-                'category': category,
-                'brand': brand,
-                'opening_hours': opening_hours,
-                'website': website,
-                'phone': phone,
-                'additional_info': additional_info,
-                'location': (center_lat, center_lon),
-                'distance_from_route_m': round(distance, 1),
-                'geometry_type': 'way',
-                'node_count': len(valid_nodes),
-                'osm_link': f"https://openstreetmap.org/way/{way.id}"
-            }
-    
         except Exception as e:
-            print(f"⚠️  Error extracting amenity way info for way {getattr(way, 'id', 'unknown')}: {e}")
+            logger.warning(f"Error extracting amenity way info for way {way.get('id', 'unknown')}: {e}")
             return None
 
     def create_amenity_detour(self, amenity: Dict[str, Any], 
@@ -469,50 +842,104 @@ class RouteAnalysisAgent:
             'description': f"{amenity['name']} ({amenity['type']}) - {amenity['distance_from_route_m']:.0f}m from route"
         }
 
-    def create_simple_way_detour(self, way: Dict[str, Any], 
-                     main_route_lat: float, main_route_lon: float) -> Dict[str, Any]:
-        """Create a simple detour opportunity for a way with just ID and middle node."""
-        
-        # Calculate distance from main route to middle node
-        mid_lat = way['middle_node']['lat']
-        mid_lon = way['middle_node']['lon']
-        distance = self.haversine_distance((main_route_lat, main_route_lon), (mid_lat, mid_lon)) * 1000
-        
+    def create_simple_way_detour(self, way: Dict[str, Any],
+                     main_route_lat: float, main_route_lon: float,
+                     distance_m: Optional[float] = None) -> Dict[str, Any]:
+        """Create a simple detour opportunity for a way with just ID and middle node.
+
+        distance_m lets callers that batch-computed middle-node distances
+        (anchor trig hoisted into one vectorized pass) skip the per-way
+        haversine here, leaving this as a pure dict-builder.
+        """
+        if distance_m is None:
+            # Reuse the distance attached at extraction time when present,
+            # mirroring the amenity path; recompute only for direct callers
+            distance_m = way.get('distance_from_route_m')
+        if distance_m is None:
+            mid_lat = way['middle_node']['lat']
+            mid_lon = way['middle_node']['lon']
+            distance_m = haversine_m(main_route_lat, main_route_lon, mid_lat, mid_lon)
+
         return {
             'type': 'way',
             'way': way,
-            'detour_distance_m': distance,
-            'description': f"Way {way['id']} - {distance:.0f}m from route"
+            'detour_distance_m': distance_m,
+            'description': f"Way {way['id']} - {distance_m:.0f}m from route"
         }
     
-    def analyze_route(self, geojson_file: str, sample_distance_m: float = 300, 
-                 detour_radius_m: float = 200) -> Dict[str, Any]:
+    def analyze_route(self, geojson_file: str, sample_distance_m: float = 300,
+                 detour_radius_m: float = 200,
+                 max_distance_m: Optional[float] = None,
+                 type_whitelist: Optional[set] = None) -> Dict[str, Any]:
         """
         Analyze a complete route for detour opportunities.
+
+        max_distance_m and type_whitelist are pushed down to the per-point
+        search so amenities the caller would reject are never collected.
         """
-        print(f"🗺️  Analyzing route from {geojson_file}")
-        
-        # Load route coordinates
-        coordinates = self.load_geojson_route(geojson_file)
+        logger.debug(f"Analyzing route from {geojson_file}")
+
+        # Load route coordinates (and spatial index) from the shared
+        # per-file context so repeat analyses skip the setup work
+        route_ctx = self._route_context(geojson_file)
+        coordinates = route_ctx['coordinates']
         if not coordinates:
             return {"error": "Could not load route coordinates"}
         
-        print(f"📍 Route has {len(coordinates)} coordinate points")
+        logger.debug(f"Route has {len(coordinates)} coordinate points")
         
         # Sample coordinates
         sampled_coords = self.sample_route_coordinates(coordinates, sample_distance_m)
-        print(f"🎯 Analyzing {len(sampled_coords)} sample points")
+        logger.debug(f"Analyzing {len(sampled_coords)} sample points")
         
-        # Find detour opportunities at each sample point
+        # Find detour opportunities for all sample points in a handful of
+        # batched Overpass requests instead of two per point
+        per_point_detours = self._find_detours_batched(sampled_coords, detour_radius_m,
+                                                       max_distance_m=max_distance_m,
+                                                       type_whitelist=type_whitelist)
+
+        # Calculate actual route distance: one SoA pass over contiguous
+        # arrays instead of a Python haversine call per segment
+        coords = np.asarray(coordinates, dtype=np.float64)  # (lat, lon) rows
+        route_distance_km = float(cumulative_distance_m(coords[:, 1], coords[:, 0])[-1]) / 1000
+
+        # Upgrade sample-point distances to true distance-to-route via a
+        # kd-tree over the full polyline (brute-force kernel from utils
+        # without scipy), covering *every* sighting before anything
+        # consumes the lists: refining after the per-point sort, or only
+        # the first occurrences kept by dedup, would break the
+        # nearest-first order the orchestrator's cutoff break relies on
+        # and leave duplicate sightings with stale distances
+        amenity_sightings = [d for detours in per_point_detours
+                             for d in detours if d['type'] == 'amenity']
+        if amenity_sightings:
+            route_index = route_ctx['index']
+            if route_index is not None:
+                self._refine_distances_to_route(route_index, amenity_sightings)
+            else:
+                locations = np.array([d['amenity']['location'] for d in amenity_sightings])
+                distances, _ = nearest_route_distance_m(coords[:, 0], coords[:, 1],
+                                                        locations[:, 0], locations[:, 1])
+                for detour, distance in zip(amenity_sightings, distances):
+                    distance = round(float(distance), 1)
+                    detour['amenity']['distance_from_route_m'] = distance
+                    detour['detour_distance_m'] = distance
+
+            # Restore nearest-first order within each point's amenity
+            # block; ways keep their place after it
+            for detours in per_point_detours:
+                amenities = [d for d in detours if d['type'] == 'amenity']
+                if len(amenities) > 1:
+                    ways = [d for d in detours if d['type'] != 'amenity']
+                    amenities.sort(key=lambda d: d['detour_distance_m'])
+                    detours[:] = amenities + ways
+
         all_detours = []
         route_segments = []
-        
-        for i, (lat, lon) in enumerate(sampled_coords):
-            print(f"🔍 Searching detours near point {i+1}/{len(sampled_coords)}...")
-            
-            detours = self.find_detour_opportunities(lat, lon, detour_radius_m)
-            print(f"    Found {len(detours)} detours at this point")
-            
+
+        for i, ((lat, lon), detours) in enumerate(zip(sampled_coords, per_point_detours)):
+            logger.debug(f"    Found {len(detours)} detours at point {i+1}/{len(sampled_coords)}")
+
             segment_data = {
                 'segment_id': i + 1,
                 'coordinate': (lat, lon),
@@ -522,34 +949,30 @@ class RouteAnalysisAgent:
             route_segments.append(segment_data)
             all_detours.extend(detours)
 
-        print(f"📊 Total detours found before deduplication: {len(all_detours)}")
-
-        # Calculate actual route distance
-        route_distance_km = 0
-        for i in range(len(coordinates) - 1):
-            route_distance_km += self.haversine_distance(coordinates[i], coordinates[i + 1])
+        logger.debug(f"Total detours found before deduplication: {len(all_detours)}")
 
-        # Remove duplicate detours by ID
-        unique_detours = {}
-        for detour in all_detours:
-            if detour['type'] == 'amenity':
-                key = f"amenity_{detour['amenity']['id']}"
-            elif detour['type'] == 'way':
-                key = f"way_{detour['way']['id']}"
-            else:
-                continue
-    
-            if key not in unique_detours:
-                unique_detours[key] = detour
-
-        unique_detours = list(unique_detours.values())
-        print(f"📊 After deduplication: {len(unique_detours)} unique detours")
-
-        # Categorize detours
-        amenity_detours = [d for d in unique_detours if d['type'] == 'amenity']
-        way_detours = [d for d in unique_detours if d['type'] == 'way']
+        # Remove duplicate detours by ID in one vectorized pass: each
+        # detour maps to a (type_code, osm_id) int64 row, np.unique picks
+        # the first occurrence of each, and sorting those indices keeps
+        # the original encounter order
+        unique_detours = []
+        amenity_detours = []
+        way_detours = []
+        if all_detours:
+            keys = np.array([(d['type'] == 'way',
+                              d['way']['id'] if d['type'] == 'way' else d['amenity']['id'])
+                             for d in all_detours], dtype=np.int64)
+            _, first_seen = np.unique(keys, axis=0, return_index=True)
+            for i in np.sort(first_seen):
+                detour = all_detours[i]
+                unique_detours.append(detour)
+                if keys[i, 0]:
+                    way_detours.append(detour)
+                else:
+                    amenity_detours.append(detour)
+        logger.debug(f"After deduplication: {len(unique_detours)} unique detours")
 
-        print(f"📊 Final counts: {len(amenity_detours)} amenities, {len(way_detours)} ways")
+        logger.debug(f"Final counts: {len(amenity_detours)} amenities, {len(way_detours)} ways")
 
         return {
             'route_file': geojson_file,
@@ -580,7 +1003,7 @@ class RouteAnalysisAgent:
         from datetime import datetime
         analysis['analysis_date'] = datetime.now().isoformat()
 
-        print(f"💾 Saving analysis with {analysis['detour_summary']['amenity_detours']} amenities and {analysis['detour_summary']['way_detours']} ways")
+        logger.debug(f"Saving analysis with {analysis['detour_summary']['amenity_detours']} amenities and {analysis['detour_summary']['way_detours']} ways")
 
         # Create a clean structure for the JSON output
         clean_output = {
@@ -637,21 +1060,21 @@ class RouteAnalysisAgent:
                     }
                     segment_info['detours']['ways'].append(way_info)
 
-        clean_output['sampling_points'].append(segment_info)
+            clean_output['sampling_points'].append(segment_info)
 
-        with open(output_file, 'w') as f:
-            json.dump(clean_output, f, indent=2, default=str)
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(clean_output, option=orjson.OPT_INDENT_2, default=str))
 
-        print(f"📋 Analysis saved to {output_file}")
-        print(f"🎯 Saved {len(clean_output['sampling_points'])} sampling points")
+        logger.debug(f"Analysis saved to {output_file}")
+        logger.debug(f"Saved {len(clean_output['sampling_points'])} sampling points")
         
         # Count total unique detours across all points
         total_amenities = sum(len(point['detours']['amenities']) for point in clean_output['sampling_points'])
         total_ways = sum(len(point['detours']['ways']) for point in clean_output['sampling_points'])
         
-        print(f"🏪 Total amenity instances: {total_amenities}")
-        print(f"🛣️  Total way instances: {total_ways}")
-        print(f"📍 Note: Same amenities/ways may appear at multiple sampling points")
+        logger.debug(f"Total amenity instances: {total_amenities}")
+        logger.debug(f"Total way instances: {total_ways}")
+        logger.debug(f"Note: Same amenities/ways may appear at multiple sampling points")
 
         return output_file
 
@@ -1,11 +1,504 @@
+import asyncio
+import copy
+import functools
+import hashlib
 import openai
+import os
+import random
+import time
 import json
+import math
+import numpy as np
+import orjson
+import overpy
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import List, Dict, Optional, Any
 
 
+def create_http_session(pool_size: int = 16, retries: int = 5) -> requests.Session:
+    """
+    Create a requests.Session with connection pooling and retries for the
+    OSRM / Overpass HTTP calls. Reusing one session keeps connections alive
+    so repeat requests skip the TCP+TLS handshake, and the retry policy
+    recovers from the public servers' transient 429/5xx responses.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=retries,
+            status_forcelist=[429, 500, 502, 503, 504],
+            backoff_factor=0.5,
+            respect_retry_after_header=True
+        )
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Accept-Encoding"] = "gzip"
+    return session
+
+
+# Shared session for all OSRM / Overpass requests
+SESSION = create_http_session()
+
+# Both services are configurable so a local docker mirror (osrm/osrm-backend,
+# wiktorn/overpass-api) can replace the rate-limited public instances
+OSRM_BASE = os.environ.get("OSRM_BASE", "http://router.project-osrm.org")
+
+OVERPASS_URL = os.environ.get("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+
+
+def get_osrm_route(lon1: float, lat1: float, lon2: float, lat2: float,
+                   profile: str = "bicycle", overview: str = "simplified") -> Dict[str, Any]:
+    """
+    Fetch an OSRM route between two points, memoized by endpoints.
+
+    Coordinates are quantized to 5 decimals (~1m) so near-identical
+    endpoints collapse into one cache entry and repeat lookups become a
+    dict hit instead of an HTTP round trip.
+
+    overview defaults to "simplified", which returns 5-50x fewer
+    coordinates than "full"; pass overview="full" only when the complete
+    polyline is actually needed (e.g. for rendering or saving).
+    """
+    return _get_osrm_route_cached(
+        round(lon1, 5), round(lat1, 5),
+        round(lon2, 5), round(lat2, 5),
+        profile, overview
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def _get_osrm_route_cached(lon1: float, lat1: float, lon2: float, lat2: float,
+                           profile: str, overview: str) -> Dict[str, Any]:
+    return route_many([(lat1, lon1), (lat2, lon2)], profile=profile, overview=overview)
+
+
+def decode_polyline6(encoded: str) -> tuple:
+    """
+    Decode an OSRM polyline6 geometry string into SoA numpy arrays.
+
+    Requesting geometries=polyline6 shrinks the wire payload roughly 4x
+    versus geojson float lists, and the decoded (lons, lats) float64
+    arrays are ~10x smaller in memory than nested Python lists while
+    letting downstream haversine/bbox math run as vector ops.
+
+    Returns:
+        (lons, lats) as contiguous float64 arrays
+    """
+    import polyline
+
+    coords = np.asarray(polyline.decode(encoded, precision=6), dtype=np.float64)
+    if coords.size == 0:
+        return np.empty(0), np.empty(0)
+    return np.ascontiguousarray(coords[:, 1]), np.ascontiguousarray(coords[:, 0])
+
+
+class _LazyPolyline6:
+    """
+    Polyline6-encoded LineString coordinates, decoded on first access.
+
+    Keeping the compact wire string and deferring polyline.decode means
+    callers that never touch individual coordinates (e.g. converting a
+    route with include_properties=False and passing it along) pay zero
+    decode cost. Decoded [lon, lat] pairs are memoized after the first
+    access.
+    """
+    __slots__ = ('encoded', '_coords')
+
+    def __init__(self, encoded: str):
+        self.encoded = encoded
+        self._coords = None
+
+    def _decode(self):
+        if self._coords is None:
+            import polyline
+            self._coords = [[lon, lat] for lat, lon in polyline.decode(self.encoded, precision=6)]
+        return self._coords
+
+    def __iter__(self):
+        return iter(self._decode())
+
+    def __len__(self):
+        return len(self._decode())
+
+    def __getitem__(self, index):
+        return self._decode()[index]
+
+
+def _geojson_default(obj):
+    """orjson hook: materialize lazy polyline coordinates at write time."""
+    if isinstance(obj, _LazyPolyline6):
+        return obj._decode()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Scalar great-circle distance in meters.
+
+    JIT-compiled with numba when it is installed, which removes the
+    interpreter overhead from the per-amenity distance checks in large
+    route analyses; otherwise it runs as plain Python math.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    # atan2 form: numerically robust for near-antipodal points, same cost
+    return 2 * EARTH_RADIUS_M * math.atan2(math.sqrt(a), math.sqrt(1.0 - a))
+
+
+try:
+    from numba import njit
+    haversine_m = njit(cache=True)(haversine_m)
+except ImportError:
+    pass  # numba is optional; the pure-Python kernel works everywhere
+
+
+def haversine_np(lats1, lons1, lats2, lons2):
+    """
+    Vectorized great-circle distance in meters between paired points.
+
+    Accepts scalars or arrays (degrees); a NumPy pass over contiguous
+    float64 replaces ~6 Python math calls per point, typically 30-100x
+    faster for a few thousand points.
+    """
+    lats1, lons1, lats2, lons2 = (np.radians(np.asarray(a, dtype=np.float64))
+                                  for a in (lats1, lons1, lats2, lons2))
+    dlat = lats2 - lats1
+    dlon = lons2 - lons1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lats1) * np.cos(lats2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def _nearest_point_kernel(lat_r, lon_r, lat_a, lon_a):
+    """
+    NumPy fallback for the nearest-route-point search: one broadcast
+    haversine matrix, reduced with argmin per query row. Inputs are in
+    radians; fine up to a few million route x query pairs.
+    """
+    dlat = lat_a[:, None] - lat_r[None, :]
+    dlon = lon_a[:, None] - lon_r[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat_a)[:, None] * np.cos(lat_r)[None, :] * np.sin(dlon / 2) ** 2
+    d = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+    idx = d.argmin(axis=1)
+    return d[np.arange(lat_a.size), idx], idx
+
+
+try:
+    from numba import njit, prange
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _nearest_point_kernel(lat_r, lon_r, lat_a, lon_a):  # noqa: F811
+        # Fused loop version: no (M, N) temporaries, cos(lat_r) hoisted,
+        # query rows spread across cores with prange
+        out_d = np.empty(lat_a.size)
+        out_i = np.zeros(lat_a.size, dtype=np.int64)
+        cos_r = np.cos(lat_r)
+        for i in prange(lat_a.size):
+            cos_a = math.cos(lat_a[i])
+            best = 1e30
+            best_j = 0
+            for j in range(lat_r.size):
+                sdlat = math.sin((lat_r[j] - lat_a[i]) / 2)
+                sdlon = math.sin((lon_r[j] - lon_a[i]) / 2)
+                h = sdlat * sdlat + cos_a * cos_r[j] * sdlon * sdlon
+                d = 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+                if d < best:
+                    best = d
+                    best_j = j
+            out_d[i] = best
+            out_i[i] = best_j
+        return out_d, out_i
+except ImportError:
+    pass  # numba is optional; the NumPy kernel works everywhere
+
+
+def nearest_route_distance_m(route_lats, route_lons, query_lats, query_lons):
+    """
+    Minimum great-circle distance from each query point to any route point.
+
+    Args:
+        route_lats, route_lons: route coordinates in degrees
+        query_lats, query_lons: query coordinates in degrees
+
+    Returns:
+        (distances_m, indices): per-query nearest distance in meters and
+        the index of the closest route point.
+    """
+    lat_r, lon_r, lat_a, lon_a = (np.radians(np.ascontiguousarray(a, dtype=np.float64))
+                                  for a in (route_lats, route_lons, query_lats, query_lons))
+    return _nearest_point_kernel(lat_r, lon_r, lat_a, lon_a)
+
+
+def _anchor_distances_kernel(lat0_r, lon0_r, lat_a, lon_a):
+    """
+    NumPy fallback for anchor-to-many distances (radians in): the
+    anchor's trig is computed once and broadcast over the candidates.
+    """
+    dlat = lat_a - lat0_r
+    dlon = lon_a - lon0_r
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat0_r) * np.cos(lat_a) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+try:
+    from numba import njit, prange
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _anchor_distances_kernel(lat0_r, lon0_r, lat_a, lon_a):  # noqa: F811
+        # Fused loop: anchor trig hoisted, candidates spread across cores
+        out = np.empty(lat_a.size)
+        cos0 = math.cos(lat0_r)
+        for i in prange(lat_a.size):
+            sdlat = math.sin((lat_a[i] - lat0_r) / 2)
+            sdlon = math.sin((lon_a[i] - lon0_r) / 2)
+            h = sdlat * sdlat + cos0 * math.cos(lat_a[i]) * sdlon * sdlon
+            out[i] = 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+        return out
+except ImportError:
+    pass  # numba is optional; the NumPy kernel works everywhere
+
+
+def haversine_many_m(lat0: float, lon0: float, lats, lons) -> np.ndarray:
+    """
+    Great-circle distance in meters from one anchor to many points.
+
+    This 1:many shape shows up when scoring every POI against a single
+    sample point; the kernel is numba-compiled (parallel, fastmath,
+    disk-cached) when numba is installed and falls back to a NumPy
+    broadcast otherwise.
+
+    Args:
+        lat0, lon0: anchor coordinate in degrees
+        lats, lons: candidate coordinates in degrees
+
+    Returns:
+        Array of distances in meters, one per candidate
+    """
+    lat_a = np.radians(np.ascontiguousarray(lats, dtype=np.float64))
+    lon_a = np.radians(np.ascontiguousarray(lons, dtype=np.float64))
+    return _anchor_distances_kernel(math.radians(lat0), math.radians(lon0), lat_a, lon_a)
+
+
+def cumulative_distance_m(lons, lats) -> np.ndarray:
+    """
+    Cumulative along-route distance in meters for SoA coordinate arrays,
+    starting at 0 for the first point.
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    if lons.size < 2:
+        return np.zeros(lons.size)
+    seg = haversine_np(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    return np.concatenate(([0.0], np.cumsum(seg)))
+
+
+def route_soa(route: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """
+    Structure-of-arrays view of an OSRM route response.
+
+    The nested [[lon, lat], ...] lists are unpacked once into contiguous
+    float64 arrays plus cumulative along-route distance, so downstream
+    geometry code (sampling, bbox, nearest-point search) runs as vector
+    ops instead of per-point dict/list indexing.
+
+    Returns:
+        {'lons', 'lats', 'cum_dist_m'} arrays, all of equal length.
+    """
+    coords = np.asarray(route['routes'][0]['geometry']['coordinates'], dtype=np.float64)
+    lons = np.ascontiguousarray(coords[:, 0])
+    lats = np.ascontiguousarray(coords[:, 1])
+    return {'lons': lons, 'lats': lats, 'cum_dist_m': cumulative_distance_m(lons, lats)}
+
+
+def route_many(points: List[tuple], profile: str = "bicycle",
+               overview: str = "full", geometries: str = "geojson",
+               base_url: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Route through any number of (lat, lon) waypoints with a single
+    multi-waypoint OSRM request instead of one request per pair.
+
+    The response carries one leg per consecutive pair in
+    route['routes'][0]['legs'], so callers can still read per-pair
+    distance/duration while paying for only one HTTP round trip.
+    """
+    if len(points) < 2:
+        raise ValueError("Need at least two waypoints to route")
+
+    if base_url is None:
+        base_url = OSRM_BASE
+    coord_string = ";".join(f"{lon},{lat}" for lat, lon in points)
+    url = f"{base_url}/route/v1/{profile}/{coord_string}?overview={overview}&geometries={geometries}&annotations=false"
+    # orjson parses the large geojson bodies a few times faster than
+    # response.json(), and stream=True avoids buffering the body twice
+    response = SESSION.get(url, timeout=(3, 10), stream=True)
+    return orjson.loads(response.content)
+
+
+def osrm_table(sources: List[tuple], destinations: List[tuple],
+               profile: str = "bicycle", base_url: Optional[str] = None) -> List[List[Optional[float]]]:
+    """
+    Fetch a many-to-many road-distance matrix from the OSRM /table service.
+
+    One /table call replaces a routing request per (source, destination)
+    pair, which is the difference between O(M) HTTP round trips and one
+    when scoring many candidate detours at once.
+
+    Args:
+        sources: (lat, lon) origin points
+        destinations: (lat, lon) target points
+
+    Returns:
+        A len(sources) x len(destinations) matrix of road distances in
+        meters; entries are None where OSRM found no path.
+    """
+    sources = list(sources)
+    destinations = list(destinations)
+    if not sources or not destinations:
+        raise ValueError("Need at least one source and one destination")
+
+    if base_url is None:
+        base_url = OSRM_BASE
+    coord_string = ";".join(f"{lon},{lat}" for lat, lon in sources + destinations)
+    url = f"{base_url}/table/v1/{profile}/{coord_string}"
+    params = {
+        "sources": ";".join(map(str, range(len(sources)))),
+        "destinations": ";".join(map(str, range(len(sources), len(sources) + len(destinations)))),
+        "annotations": "distance",
+    }
+    response = SESSION.get(url, params=params, timeout=(3, 10), stream=True)
+    return orjson.loads(response.content)["distances"]
+
+
+async def fetch_route(client, semaphore, lon1: float, lat1: float, lon2: float, lat2: float,
+                      profile: str = "bicycle", overview: str = "full",
+                      base_url: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Fetch a single OSRM route with an async client. The semaphore bounds
+    concurrency so we stay within the public demo server's limits.
+    """
+    if base_url is None:
+        base_url = OSRM_BASE
+    url = f"{base_url}/route/v1/{profile}/{lon1},{lat1};{lon2},{lat2}?overview={overview}&geometries=geojson"
+    async with semaphore:
+        response = await client.get(url, timeout=10)
+        return response.json()
+
+
+def fetch_routes(pairs: List[tuple], profile: str = "bicycle",
+                 overview: str = "full", max_concurrency: int = 4,
+                 base_url: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Fetch several independent OSRM routes concurrently.
+
+    pairs is a list of ((lat1, lon1), (lat2, lon2)) tuples that cannot be
+    merged into one multi-waypoint request (different profiles, disjoint
+    networks). Running them concurrently makes wall time max(latencies)
+    instead of sum(latencies).
+    """
+    import httpx
+
+    async def _gather():
+        semaphore = asyncio.Semaphore(max_concurrency)
+        limits = httpx.Limits(max_connections=8)
+        async with httpx.AsyncClient(limits=limits) as client:
+            tasks = [
+                fetch_route(client, semaphore, lon1, lat1, lon2, lat2,
+                            profile=profile, overview=overview, base_url=base_url)
+                for (lat1, lon1), (lat2, lon2) in pairs
+            ]
+            return await asyncio.gather(*tasks)
+
+    return asyncio.run(_gather())
+
+# Overpass results change rarely (hours to days), so cache them on disk
+OVERPASS_CACHE_DIR = os.path.expanduser("~/.cache/biker-buddy/overpass")
+
+
+def cached_overpass_query_raw(query: str, ttl_s: int = 86400) -> Dict[str, Any]:
+    """
+    Run an Overpass query and return the parsed JSON payload, with an
+    on-disk cache so repeat runs skip the multi-second round trip (and
+    its rate-limit wait).
+
+    Callers that only read element ids/coords/tags should prefer this
+    over cached_overpass_query: it skips building the overpy object
+    graph, which allocates a Node/Way instance per element and accounts
+    for a sizable share of parse time on large responses.
+
+    Args:
+        query: Overpass QL query text
+        ttl_s: How long cached responses stay valid, in seconds
+
+    Returns:
+        Parsed Overpass JSON payload (with its 'elements' list)
+    """
+    key = hashlib.blake2b(query.encode()).hexdigest()
+    cache_file = os.path.join(OVERPASS_CACHE_DIR, f"{key}.json")
+
+    if os.path.exists(cache_file) and time.time() - os.path.getmtime(cache_file) < ttl_s:
+        with open(cache_file) as f:
+            return json.load(f)
+
+    # Jittered exponential backoff on top of the session's HTTP retries,
+    # since Overpass also fails with parse-level errors under load
+    last_error = None
+    for attempt in range(4):
+        if attempt:
+            time.sleep(min(30, random.uniform(1, 2 ** attempt)))
+        try:
+            response = SESSION.post(OVERPASS_URL, data=query, timeout=(3.05, 60))
+            response.raise_for_status()
+            data = response.json()
+            break
+        except Exception as e:
+            last_error = e
+    else:
+        raise last_error
+
+    os.makedirs(OVERPASS_CACHE_DIR, exist_ok=True)
+    with open(cache_file, "w") as f:
+        json.dump(data, f)
+
+    return data
+
+
+def cached_overpass_query(query: str, api: Optional[Any] = None, ttl_s: int = 86400):
+    """
+    Run an Overpass query with the on-disk cache, returning an
+    overpy.Result for callers that want the full object graph.
+
+    Args:
+        query: Overpass QL query text
+        api: Optional overpy.Overpass instance used to rebuild results
+        ttl_s: How long cached responses stay valid, in seconds
+
+    Returns:
+        overpy.Result for the query
+    """
+    if api is None:
+        api = overpy.Overpass(url=OVERPASS_URL)
+    return overpy.Result.from_json(cached_overpass_query_raw(query, ttl_s=ttl_s), api=api)
+
+
+@functools.lru_cache(maxsize=8)
 def create_openai_client(api_key: str):
     """
     Initializes and returns the OpenAI API client with the given API key.
+
+    Cached per key so repeat calls reuse the same client and its httpx
+    connection pool (warm TCP/TLS sessions) instead of paying the socket
+    setup on every prompt. openai.OpenAI is thread-safe, so a shared
+    instance can serve concurrent callers; use
+    create_openai_client.cache_clear() to drop cached clients.
     """
     return openai.OpenAI(api_key=api_key)
 
@@ -45,8 +538,15 @@ def call_chat_completion(
         max_tokens=max_tokens,
         **kwargs
     )
-    response = response.model_dump()  # Convert pydantic object to dict
-    return response["choices"][0]["message"]["content"].strip()
+    # Read the content attribute path directly instead of model_dump(),
+    # which recursively converts every field (usage, logprobs, ...) to
+    # dicts just to index one of them
+    return response.choices[0].message.content.strip()
+# Responses for idempotent prompts, keyed by a hash of the full payload
+_LLM_RESPONSE_CACHE: Dict[str, str] = {}
+_LLM_RESPONSE_CACHE_MAX = 512
+
+
 def chat_with_openai(
     api_key: str,
     system_prompt: str,
@@ -55,74 +555,263 @@ def chat_with_openai(
     model: str = "gpt-4",
     temperature: float = 0.7,
     max_tokens: Optional[int] = None,
+    cache: bool = False,
     **kwargs
 ) -> str:
     """
     High-level utility to initialize the client, format messages, and get a response.
+
+    Pass cache=True for idempotent calls (e.g. deterministic tool selection)
+    to serve repeat prompts from memory instead of re-hitting the API.
     """
-    client = create_openai_client(api_key)
     messages = format_messages(system_prompt, user_prompt, additional_messages)
-    return call_chat_completion(messages, model, temperature, max_tokens, client=client, **kwargs)
 
+    cache_key = None
+    if cache:
+        # kwargs (tools, response_format, ...) change the response just
+        # as much as the prompt, so they belong in the hashed payload;
+        # default=str keys non-JSON values by their string form
+        payload = {"model": model, "temperature": temperature,
+                   "max_tokens": max_tokens, "messages": messages,
+                   "kwargs": kwargs}
+        cache_key = hashlib.blake2b(
+            json.dumps(payload, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        if cache_key in _LLM_RESPONSE_CACHE:
+            return _LLM_RESPONSE_CACHE[cache_key]
+
+    client = create_openai_client(api_key)
+    response = call_chat_completion(messages, model, temperature, max_tokens, client=client, **kwargs)
+
+    if cache_key is not None:
+        if len(_LLM_RESPONSE_CACHE) >= _LLM_RESPONSE_CACHE_MAX:
+            # Drop the oldest entry (dicts preserve insertion order)
+            _LLM_RESPONSE_CACHE.pop(next(iter(_LLM_RESPONSE_CACHE)))
+        _LLM_RESPONSE_CACHE[cache_key] = response
+
+    return response
 
-def osrm_route_to_geojson(osrm_response: Dict[str, Any], include_properties: bool = True) -> Dict[str, Any]:
+
+def chat_with_openai_batch(
+    api_key: str,
+    items: List[tuple],
+    model: str = "gpt-4",
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None,
+    max_concurrency: int = 10,
+    **kwargs
+) -> List[str]:
+    """
+    Run many independent chat completions concurrently.
+
+    items is a list of (system_prompt, user_prompt) tuples. Each request
+    is an independent network round trip, so firing them through
+    asyncio.gather makes wall time max(latencies) instead of
+    sum(latencies), same as fetch_routes does for OSRM. The semaphore
+    bounds in-flight requests, and rate-limit errors are retried with
+    jittered exponential backoff before giving up.
+
+    Returns:
+        Responses in the same order as items.
+    """
+
+    async def _one(client, semaphore, system_prompt, user_prompt):
+        messages = format_messages(system_prompt, user_prompt)
+        async with semaphore:
+            for attempt in range(4):
+                if attempt:
+                    await asyncio.sleep(min(30, random.uniform(1, 2 ** attempt)))
+                try:
+                    response = await client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        **kwargs
+                    )
+                    return response.choices[0].message.content.strip()
+                except openai.RateLimitError:
+                    if attempt == 3:
+                        raise
+
+    async def _gather():
+        # The client (and its httpx pool) must live and die with this
+        # event loop: asyncio.run closes the loop on return, so a client
+        # cached across calls would hold transports bound to a dead loop
+        async with openai.AsyncOpenAI(api_key=api_key) as client:
+            semaphore = asyncio.Semaphore(max_concurrency)
+            tasks = [_one(client, semaphore, system_prompt, user_prompt)
+                     for system_prompt, user_prompt in items]
+            return await asyncio.gather(*tasks)
+
+    return asyncio.run(_gather())
+
+
+# Converted features for repeat renders of the same routes, keyed by a
+# cheap route signature (same bounded-dict scheme as _LLM_RESPONSE_CACHE)
+_CONVERT_CACHE: Dict[Any, Dict[str, Any]] = {}
+_CONVERT_CACHE_MAX = 1024
+
+
+def _convert_cache_key(route: Dict[str, Any], include_properties: bool, as_numpy: bool):
+    """
+    Stable, cheap-to-build signature for a route conversion; None when
+    the geometry shape doesn't allow one.
+    """
+    geometry = route.get('geometry')
+    if isinstance(geometry, str):
+        endpoints = geometry  # encoded polyline is already compact and hashable
+    elif isinstance(geometry, dict) and geometry.get('coordinates'):
+        coords = geometry['coordinates']
+        if not isinstance(coords, list):
+            return None
+        endpoints = (tuple(coords[0]), tuple(coords[-1]), len(coords))
+    else:
+        return None
+    return (include_properties, as_numpy, route.get('weight'),
+            route.get('distance'), route.get('duration'), endpoints)
+
+
+def osrm_route_to_geojson(osrm_response: Dict[str, Any], include_properties: bool = True,
+                          as_numpy: bool = False) -> Dict[str, Any]:
     """
     Convert OSRM route response to GeoJSON format.
-    
+
+    Repeated conversions of the same route (map re-renders, re-runs in a
+    session) are served from a bounded cache; hits return a deep copy so
+    callers can attach route_name/route_id without poisoning later hits.
+
     Args:
         osrm_response: The response from OSRM routing API
         include_properties: Whether to include route metadata in properties
-    
+        as_numpy: Store coordinates as a contiguous (N, 2) float64 array
+            and add a 'center' property computed as one vectorized mean.
+            Downstream geometry code can then run NumPy reductions instead
+            of Python loops; serialization still works via
+            orjson.OPT_SERIALIZE_NUMPY.
+
     Returns:
         GeoJSON Feature containing the route as a LineString
     """
     if not osrm_response or 'routes' not in osrm_response or not osrm_response['routes']:
         raise ValueError("Invalid or empty OSRM response")
-    
+
     route = osrm_response['routes'][0]  # Take the first (best) route
-    
+
     # Extract the geometry (coordinates)
     if 'geometry' not in route:
         raise ValueError("No geometry found in route")
-    
+
+    cache_key = _convert_cache_key(route, include_properties, as_numpy)
+    if cache_key is not None:
+        cached = _CONVERT_CACHE.get(cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+
     geometry = route['geometry']
-    
-    # Build properties with route metadata
-    properties = {}
+
+    # geometries=polyline6 responses carry the geometry as a compact
+    # string (~5x smaller on the wire); keep it encoded and decode only
+    # when coordinates are actually read
+    if isinstance(geometry, str):
+        geometry = {'type': 'LineString', 'coordinates': _LazyPolyline6(geometry)}
+
+    center = None
+    if as_numpy:
+        coords = np.asarray(geometry['coordinates'], dtype=np.float64)
+        geometry = {'type': geometry.get('type', 'LineString'), 'coordinates': coords}
+        center = coords.mean(axis=0)  # (lon, lat), one pass in C
+
+    # Build properties with route metadata: one dict literal, no
+    # throwaway allocation, and each waypoint fetched into a local once
     if include_properties:
         properties = {
-            'distance_km': round(route.get('distance', 0) / 1000, 2),
-            'duration_minutes': round(route.get('duration', 0) / 60, 1),
+            # Multiply by the folded reciprocal: FP multiply is cheaper
+            # than divide, and this runs per route in collection builds
+            'distance_km': round(route.get('distance', 0) * 1e-3, 2),
+            'duration_minutes': round(route.get('duration', 0) * (1.0 / 60.0), 1),
             'weight': route.get('weight', 0),
             'weight_name': route.get('weight_name', 'unknown')
         }
-        
+        if center is not None:
+            properties['center'] = center
+
         # Add waypoint information if available
-        if 'waypoints' in osrm_response:
-            waypoints = osrm_response['waypoints']
+        waypoints = osrm_response.get('waypoints')
+        if waypoints:
+            wp_start = waypoints[0]
+            wp_end = waypoints[-1]
             properties['waypoints'] = {
                 'start': {
-                    'location': waypoints[0]['location'],
-                    'name': waypoints[0].get('name', 'Start'),
-                    'distance_to_road': round(waypoints[0].get('distance', 0), 2)
+                    'location': wp_start['location'],
+                    'name': wp_start.get('name', 'Start'),
+                    'distance_to_road': round(wp_start.get('distance', 0), 2)
                 },
                 'end': {
-                    'location': waypoints[-1]['location'],
-                    'name': waypoints[-1].get('name', 'End'),
-                    'distance_to_road': round(waypoints[-1].get('distance', 0), 2)
+                    'location': wp_end['location'],
+                    'name': wp_end.get('name', 'End'),
+                    'distance_to_road': round(wp_end.get('distance', 0), 2)
                 }
             }
-    
+    else:
+        properties = {}
+
     # Create GeoJSON Feature
     geojson = {
         "type": "Feature",
         "properties": properties,
         "geometry": geometry
     }
-    
+
+    if cache_key is not None:
+        if len(_CONVERT_CACHE) >= _CONVERT_CACHE_MAX:
+            # Drop the oldest entry (dicts preserve insertion order)
+            _CONVERT_CACHE.pop(next(iter(_CONVERT_CACHE)))
+        # Store a private copy so caller-side mutations don't leak in
+        _CONVERT_CACHE[cache_key] = copy.deepcopy(geojson)
+
     return geojson
 
 
+# Serialized geometry bytes per route signature: the coordinate list is
+# by far the largest part of a feature, so repeat saves reuse its bytes
+_GEOMETRY_BYTES_CACHE: Dict[Any, bytes] = {}
+_GEOMETRY_BYTES_CACHE_MAX = 256
+
+
+def osrm_route_to_geojson_bytes(osrm_response: Dict[str, Any],
+                                include_properties: bool = True) -> bytes:
+    """
+    Convert an OSRM route straight to serialized GeoJSON Feature bytes.
+
+    When the end goal is bytes on the wire or on disk, assembling the
+    feature from pre-serialized chunks skips re-walking the wrapper dict,
+    and the geometry bytes — thousands of coordinate floats — are cached
+    per route signature so repeat saves only re-serialize the small
+    properties dict.
+
+    Returns:
+        Compact (unindented) GeoJSON Feature bytes.
+    """
+    geojson = osrm_route_to_geojson(osrm_response, include_properties=include_properties)
+
+    # Geometry is independent of the property flags, so key it without them
+    key = _convert_cache_key(osrm_response['routes'][0], False, False)
+    geometry_bytes = _GEOMETRY_BYTES_CACHE.get(key) if key is not None else None
+    if geometry_bytes is None:
+        geometry_bytes = orjson.dumps(geojson['geometry'], option=orjson.OPT_SERIALIZE_NUMPY,
+                                      default=_geojson_default)
+        if key is not None:
+            if len(_GEOMETRY_BYTES_CACHE) >= _GEOMETRY_BYTES_CACHE_MAX:
+                # Drop the oldest entry (dicts preserve insertion order)
+                _GEOMETRY_BYTES_CACHE.pop(next(iter(_GEOMETRY_BYTES_CACHE)))
+            _GEOMETRY_BYTES_CACHE[key] = geometry_bytes
+
+    properties_bytes = orjson.dumps(geojson['properties'], option=orjson.OPT_SERIALIZE_NUMPY)
+    return (b'{"type":"Feature","properties":' + properties_bytes
+            + b',"geometry":' + geometry_bytes + b'}')
+
+
 def save_route_geojson(osrm_response: Dict[str, Any], filename: str = "route.geojson") -> str:
     """
     Convert OSRM route to GeoJSON and save to file.
@@ -135,10 +824,17 @@ def save_route_geojson(osrm_response: Dict[str, Any], filename: str = "route.geo
         The filename of the saved file
     """
     geojson = osrm_route_to_geojson(osrm_response)
-    
-    with open(filename, 'w') as f:
-        json.dump(geojson, f, indent=2)
-    
+
+    # orjson serializes the nested coordinate lists several times faster
+    # than stdlib json and emits bytes in one shot; OPT_SERIALIZE_NUMPY
+    # keeps ndarray-backed coordinates writable without a tolist() pass.
+    # Serialize first, then write unbuffered: the whole payload goes out
+    # in a single syscall without a copy through the write buffer
+    data = orjson.dumps(geojson, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY,
+                        default=_geojson_default)
+    with open(filename, 'wb', buffering=0) as f:
+        f.write(data)
+
     print(f"✅ Route saved to {filename}")
     print(f"📏 Distance: {geojson['properties']['distance_km']} km")
     print(f"⏱️  Duration: {geojson['properties']['duration_minutes']} minutes")
@@ -181,6 +877,49 @@ def create_route_collection_geojson(routes: List[Dict[str, Any]], route_names: O
     }
 
 
+def save_route_collection_streaming(routes: List[Dict[str, Any]], filename: str,
+                                    route_names: Optional[List[str]] = None) -> str:
+    """
+    Write a FeatureCollection of OSRM routes to disk incrementally.
+
+    create_route_collection_geojson holds every converted feature in
+    memory before the caller serializes the lot; for hundreds of large
+    routes that peaks at the sum of all route sizes. This writer emits
+    the collection header, then converts and serializes one route at a
+    time, so peak memory stays bounded to a single feature.
+
+    Args:
+        routes: List of OSRM route responses
+        filename: Output filename for the GeoJSON file
+        route_names: Optional names for each route
+
+    Returns:
+        The filename of the saved file
+    """
+    with open(filename, 'wb', buffering=1 << 20) as f:
+        f.write(b'{"type":"FeatureCollection","features":[')
+        written = 0
+        for i, route_response in enumerate(routes):
+            try:
+                feature = osrm_route_to_geojson(route_response)
+            except Exception as e:
+                print(f"⚠️  Warning: Could not convert route {i+1}: {e}")
+                continue
+
+            route_name = route_names[i] if route_names and i < len(route_names) else f"Route {i+1}"
+            feature['properties']['route_name'] = route_name
+            feature['properties']['route_id'] = i
+
+            if written:
+                f.write(b',')
+            f.write(orjson.dumps(feature, option=orjson.OPT_SERIALIZE_NUMPY,
+                                 default=_geojson_default))
+            written += 1
+        f.write(b']}')
+
+    return filename
+
+
 # Example usage function
 def example_route_conversion():
     """Example of how to use the route conversion functions"""
@@ -209,9 +948,18 @@ def example_route_conversion():
     print("🗺️  Converting OSRM route to GeoJSON...")
     geojson = osrm_route_to_geojson(osrm_response)
     
-    # Print the result
+    # Print the result: serialize a shallow preview (first few
+    # coordinates) instead of the whole feature just to show 500 chars
+    preview = {
+        'type': geojson['type'],
+        'properties': geojson['properties'],
+        'geometry': {
+            'type': geojson['geometry']['type'],
+            'coordinates': list(geojson['geometry']['coordinates'][:5]) + ['...']
+        }
+    }
     print("📋 GeoJSON created:")
-    print(json.dumps(geojson, indent=2)[:500] + "...")
+    print(orjson.dumps(preview, option=orjson.OPT_INDENT_2).decode()[:500] + "...")
     
     # Save to file
     filename = save_route_geojson(osrm_response, "example_route.geojson")
@@ -1,17 +1,10 @@
-import overpy
-
-# Initialize Overpass API
-api = overpy.Overpass()
+import sys
 
-lat, lon = 51.043013, -114.216861
-# Define a buffer in degrees (about ~300m)
-buffer = 0.003
+import overpy
+from src.utils import cached_overpass_query
 
-south = lat - buffer
-north = lat + buffer
-west = lon - buffer
-east = lon + buffer
-query = f"""
+# Query template built once at module load; bbox values are filled in per call
+_QUERY_TMPL = """
 [out:json][timeout:25];
 (
     way["highway"="cycleway"]({south},{west},{north},{east});
@@ -34,12 +27,40 @@ out geom;
 out;
 """
 
-# Run the query
-result = api.query(query)
 
-# Print all nodes from the result
-for way in result.ways:
-    print(f"Way ID: {way.id}")
-    print(f"  highway: {way.tags.get('highway', 'N/A')}, maxspeed: {way.tags.get('maxspeed', 'N/A')}")
-    for node in way.nodes:
-        print(f"  Node ID: {node.id}, Lat: {node.lat}, Lon: {node.lon}")
\ No newline at end of file
+def find_bike_ways(lat, lon, buffer=0.003, api=None):
+    """Query Overpass for bike-friendly ways in a bbox around (lat, lon)."""
+    if api is None:
+        api = overpy.Overpass()
+
+    query = _QUERY_TMPL.format(
+        south=lat - buffer,
+        north=lat + buffer,
+        west=lon - buffer,
+        east=lon + buffer
+    )
+
+    # Run the query (cached on disk, the result rarely changes)
+    return cached_overpass_query(query, api=api)
+
+
+def main():
+    lat, lon = 51.043013, -114.216861
+    result = find_bike_ways(lat, lon)
+
+    # Print all nodes from the result: one stdout write per way instead
+    # of a print per node (ways can easily carry hundreds of nodes)
+    write = sys.stdout.write
+    for way in result.ways:
+        # One attribute fetch per way instead of a way.tags walk per field
+        tags = way.tags
+        lines = [f"Way ID: {way.id}",
+                 f"  highway: {tags.get('highway', 'N/A')}, maxspeed: {tags.get('maxspeed', 'N/A')}"]
+        lines.extend(f"  Node ID: {node.id}, Lat: {node.lat}, Lon: {node.lon}"
+                     for node in way.nodes)
+        lines.append('')
+        write('\n'.join(lines))
+
+
+if __name__ == "__main__":
+    main()